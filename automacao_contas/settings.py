@@ -173,4 +173,25 @@ CELERY_TASK_TRACK_STARTED = True
 CELERY_TASK_TIME_LIMIT = 60 * 10
 CELERY_TASK_SOFT_TIME_LIMIT = 60 * 8
 CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+CELERY_WORKER_CONCURRENCY = int(os.getenv("CELERY_WORKER_CONCURRENCY", "1"))
 CELERY_TASK_ACKS_LATE = True
+
+DOCUMENT_TEXT_CACHE_TIMEOUT = int(os.getenv("DOCUMENT_TEXT_CACHE_TIMEOUT", str(60 * 60 * 24 * 7)))
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "")
+CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "document_text": (
+        {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": CACHE_REDIS_URL,
+            "TIMEOUT": DOCUMENT_TEXT_CACHE_TIMEOUT,
+        }
+        if CACHE_REDIS_URL
+        else {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "document-text",
+            "TIMEOUT": DOCUMENT_TEXT_CACHE_TIMEOUT,
+            "OPTIONS": {"MAX_ENTRIES": 64},
+        }
+    ),
+}
@@ -1,13 +1,9 @@
-import io
 import json
 import os
-import re
-import zipfile
 
-from django.db import transaction
-from django.http import FileResponse, HttpResponse
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
-from django.utils.text import get_valid_filename
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import ensure_csrf_cookie
 from rest_framework import serializers, status, viewsets
@@ -24,21 +20,40 @@ from .intent import resolve_intent
 from .intent_catalog import TYPE_BY_BUILTIN
 from .models import (
     Document,
-    DocumentStatus,
-    ExtractionField,
     ExtractionKeyword,
-    ExtractionProfile,
     FilterPreset,
     STRATEGY_CHOICES,
     VALUE_TYPE_CHOICES,
     _normalize_keyword,
+    active_processing_q,
 )
 from .services import CORE_FIELD_KEYS, KEYWORD_PREFIX, _normalize_for_match, sanitize_payload
 from .tasks import process_document_task
-
-TERM_SPLIT_RE = re.compile(r"[,\s]+")
-MAX_BULK = 25
-SEARCH_SNIPPET_LEN = 120
+from .view_helpers import (
+    MAX_BULK,
+    _apply_preset_filters,
+    _apply_term_filters,
+    _attachment_response,
+    _build_field_choices,
+    _builtin_field_pairs,
+    _build_json_filename,
+    _build_snippet,
+    _encode_json_download,
+    _filter_enabled_fields,
+    _get_profile,
+    _iter_file_chunks,
+    _iter_json_zip_entries,
+    _load_extraction_catalog,
+    _remove_keyword_from_documents,
+    _safe_name,
+    _split_terms,
+    _unique_name,
+    _zip_buffer,
+    _zip_entry,
+    _zip_file,
+    _zip_response,
+    _zip_stream_response,
+)
 
 
 class IsAuthenticatedOrOptions(IsAuthenticated):
@@ -61,188 +76,6 @@ class DocumentPagination(PageNumberPagination):
     max_page_size = 100
 
 
-def _split_terms(raw: str) -> list[str]:
-    if not raw:
-        return []
-    if ";" in raw:
-        parts = [term.strip() for term in raw.split(";") if term.strip()]
-    else:
-        parts = [term.strip() for term in TERM_SPLIT_RE.split(raw) if term.strip()]
-    normalized_terms = []
-    seen = set()
-    for term in parts:
-        normalized = _normalize_for_match(term)
-        if not normalized or normalized in seen:
-            continue
-        seen.add(normalized)
-        normalized_terms.append(normalized)
-    return normalized_terms
-
-
-def _apply_term_filters(queryset, terms: list[str], *, mode: str = "all", field: str = "text_content_norm"):
-    if not terms:
-        return queryset
-    if mode == "any":
-        from django.db.models import Q
-
-        query = Q()
-        for term in terms:
-            query |= Q(**{f"{field}__icontains": term})
-        return queryset.filter(query)
-    for term in terms:
-        queryset = queryset.filter(**{f"{field}__icontains": term})
-    return queryset
-
-
-def _build_snippet(text: str, terms: list[str], max_len: int = SEARCH_SNIPPET_LEN) -> str:
-    if not text or not terms:
-        return ""
-    normalized = " ".join(text.split())
-    lowered = _normalize_for_match(normalized)
-    match_index = None
-    match_term = ""
-    for term in terms:
-        idx = lowered.find(term)
-        if idx == -1:
-            continue
-        if match_index is None or idx < match_index:
-            match_index = idx
-            match_term = term
-    if match_index is None:
-        return ""
-    radius = max_len // 2
-    start = max(0, match_index - radius)
-    end = min(len(normalized), match_index + len(match_term) + radius)
-    snippet = normalized[start:end].strip()
-    if start > 0:
-        snippet = "..." + snippet
-    if end < len(normalized):
-        snippet = snippet + "..."
-    return snippet
-
-
-def _apply_preset_filters(
-    queryset,
-    preset: FilterPreset,
-    *,
-    experience_min_years: int | None = None,
-    experience_max_years: int | None = None,
-    age_min_years: int | None = None,
-    age_max_years: int | None = None,
-    exclude_unknowns: bool | None = None,
-):
-    from django.db.models import Q
-
-    if not preset:
-        return queryset
-    if experience_min_years is None:
-        experience_min_years = preset.experience_min_years
-    if experience_max_years is None:
-        experience_max_years = preset.experience_max_years
-    if age_min_years is None:
-        age_min_years = preset.age_min_years
-    if age_max_years is None:
-        age_max_years = preset.age_max_years
-    if exclude_unknowns is None:
-        exclude_unknowns = preset.exclude_unknowns
-    if experience_min_years is not None:
-        if exclude_unknowns:
-            queryset = queryset.filter(extracted_experience_years__gte=experience_min_years)
-        else:
-            queryset = queryset.filter(
-                Q(extracted_experience_years__isnull=True)
-                | Q(extracted_experience_years__gte=experience_min_years)
-            )
-    if experience_max_years is not None:
-        if exclude_unknowns:
-            queryset = queryset.filter(extracted_experience_years__lte=experience_max_years)
-        else:
-            queryset = queryset.filter(
-                Q(extracted_experience_years__isnull=True)
-                | Q(extracted_experience_years__lte=experience_max_years)
-            )
-    if age_min_years is not None:
-        if exclude_unknowns:
-            queryset = queryset.filter(extracted_age_years__gte=age_min_years)
-        else:
-            queryset = queryset.filter(
-                Q(extracted_age_years__isnull=True) | Q(extracted_age_years__gte=age_min_years)
-            )
-    if age_max_years is not None:
-        if exclude_unknowns:
-            queryset = queryset.filter(extracted_age_years__lte=age_max_years)
-        else:
-            queryset = queryset.filter(
-                Q(extracted_age_years__isnull=True) | Q(extracted_age_years__lte=age_max_years)
-            )
-    return queryset
-
-
-def _build_field_choices(user):
-    fields = ExtractionField.objects.order_by("label")
-    field_choices = [(field.key, field.label) for field in fields]
-    keywords = ExtractionKeyword.objects.filter(owner=user).order_by("label")
-    keyword_choices = [(f"{KEYWORD_PREFIX}{keyword.id}", keyword.label) for keyword in keywords]
-    return field_choices + keyword_choices
-
-
-def _filter_enabled_fields(choices, enabled_fields):
-    allowed = {value for value, _ in choices}
-    filtered = [value for value in (enabled_fields or []) if value in allowed]
-    return list(dict.fromkeys(filtered))
-
-
-def _get_profile(user):
-    profile, _ = ExtractionProfile.objects.get_or_create(owner=user)
-    if profile.enabled_fields is None:
-        profile.enabled_fields = []
-        profile.save(update_fields=["enabled_fields"])
-    return profile
-
-
-def _build_json_filename(doc):
-    base_name = doc.original_filename or str(doc.id)
-    base_name = os.path.splitext(base_name)[0]
-    safe_name = get_valid_filename(base_name) or str(doc.id)
-    return f"{safe_name}.json"
-
-
-def _safe_name(filename: str, fallback: str) -> str:
-    base_name = os.path.basename(filename or "").strip()
-    if not base_name:
-        base_name = fallback
-    safe_name = get_valid_filename(base_name)
-    return safe_name or fallback
-
-
-def _unique_name(filename: str, used_names: set[str], token: str) -> str:
-    if filename not in used_names:
-        used_names.add(filename)
-        return filename
-    base, ext = os.path.splitext(filename)
-    candidate = f"{base}-{token}{ext}"
-    if candidate in used_names:
-        counter = 2
-        while f"{base}-{token}-{counter}{ext}" in used_names:
-            counter += 1
-        candidate = f"{base}-{token}-{counter}{ext}"
-    used_names.add(candidate)
-    return candidate
-
-
-def _iter_file_chunks(file_obj, chunk_size=1024 * 1024):
-    if hasattr(file_obj, "chunks"):
-        for chunk in file_obj.chunks(chunk_size=chunk_size):
-            if chunk:
-                yield chunk
-        return
-    while True:
-        chunk = file_obj.read(chunk_size)
-        if not chunk:
-            break
-        yield chunk
-
-
 def _field_to_dict(field, enabled_fields):
     is_core = field.key in CORE_FIELD_KEYS
     return {
@@ -275,18 +108,18 @@ def _keyword_to_dict(keyword, enabled_fields):
     }
 
 
-def _build_extraction_settings_payload(user, enabled_fields=None):
-    profile = _get_profile(user)
-    choices = _build_field_choices(user)
+def _build_extraction_settings_payload(user, enabled_fields=None, catalog=None):
+    catalog = catalog or _load_extraction_catalog(user)
+    fields, keywords = catalog
     if enabled_fields is None:
+        profile = _get_profile(user)
+        choices = _build_field_choices(user, catalog)
         enabled_fields = _filter_enabled_fields(choices, profile.enabled_fields)
         if enabled_fields != (profile.enabled_fields or []):
             profile.enabled_fields = enabled_fields
             profile.save(update_fields=["enabled_fields", "updated_at"])
 
-    fields = ExtractionField.objects.order_by("label")
     available_fields = [_field_to_dict(field, enabled_fields) for field in fields]
-    keywords = ExtractionKeyword.objects.filter(owner=user).order_by("label")
     keyword_items = [_keyword_to_dict(keyword, enabled_fields) for keyword in keywords]
 
     return {
@@ -352,12 +185,14 @@ class ExtractionSettingsView(APIView):
             raise ValidationError({"enabled_fields": "enabled_fields must be a list."})
 
         profile = _get_profile(request.user)
-        choices = _build_field_choices(request.user)
+        catalog = _load_extraction_catalog(request.user)
+        choices = _build_field_choices(request.user, catalog)
         enabled_fields = _filter_enabled_fields(choices, enabled_fields)
-        profile.enabled_fields = enabled_fields
-        profile.save(update_fields=["enabled_fields", "updated_at"])
+        if enabled_fields != (profile.enabled_fields or []):
+            profile.enabled_fields = enabled_fields
+            profile.save(update_fields=["enabled_fields", "updated_at"])
 
-        payload = _build_extraction_settings_payload(request.user, enabled_fields=enabled_fields)
+        payload = _build_extraction_settings_payload(request.user, enabled_fields=enabled_fields, catalog=catalog)
         return Response(payload)
 
 
@@ -380,10 +215,7 @@ class KeywordCreateView(APIView):
             raise ValidationError({"label": "label is required."})
         if not normalized:
             raise ValidationError({"label": "label is invalid."})
-        if ExtractionKeyword.objects.filter(owner=request.user, normalized_label=normalized).exists():
-            raise ValidationError({"label": "label already exists."})
-
-        builtin_fields = list(ExtractionField.objects.values_list("key", "label"))
+        builtin_fields = _builtin_field_pairs()
         intent = resolve_intent(label, builtin_fields, allow_llm=False)
         anchors = intent.anchors or [label.strip()]
         value_types = {key for key, _ in VALUE_TYPE_CHOICES}
@@ -416,19 +248,23 @@ class KeywordCreateView(APIView):
         if strategy == "below_n_lines" and "max_lines" not in strategy_params:
             strategy_params["max_lines"] = 3
 
-        keyword = ExtractionKeyword.objects.create(
-            owner=request.user,
-            label=label,
-            field_key=intent.builtin_key if intent.kind == "builtin" else "",
-            resolved_kind=intent.kind,
-            inferred_type=value_type,
-            value_type=value_type,
-            strategy=strategy,
-            strategy_params=strategy_params,
-            anchors=anchors,
-            match_strategy=intent.match_strategy,
-            confidence=float(intent.confidence or 0.0),
-        )
+        try:
+            with transaction.atomic():
+                keyword = ExtractionKeyword.objects.create(
+                    owner=request.user,
+                    label=label,
+                    field_key=intent.builtin_key if intent.kind == "builtin" else "",
+                    resolved_kind=intent.kind,
+                    inferred_type=value_type,
+                    value_type=value_type,
+                    strategy=strategy,
+                    strategy_params=strategy_params,
+                    anchors=anchors,
+                    match_strategy=intent.match_strategy,
+                    confidence=float(intent.confidence or 0.0),
+                )
+        except IntegrityError as exc:
+            raise ValidationError({"label": "label already exists."}) from exc
 
         profile = _get_profile(request.user)
         choices = _build_field_choices(request.user)
@@ -455,12 +291,7 @@ class KeywordDetailView(APIView):
             profile.enabled_fields = [value for value in profile.enabled_fields if value != keyword_key]
             profile.save(update_fields=["enabled_fields", "updated_at"])
 
-        for doc in Document.objects.filter(owner=request.user).iterator():
-            selected = doc.selected_fields or []
-            if keyword_key not in selected:
-                continue
-            doc.selected_fields = [value for value in selected if value != keyword_key]
-            doc.save(update_fields=["selected_fields"])
+        _remove_keyword_from_documents(request.user, keyword_key)
 
         keyword.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
@@ -493,8 +324,8 @@ class DocumentSerializer(serializers.ModelSerializer):
         terms = self.context.get("snippet_terms") or []
         if not terms:
             return ""
-        source = obj.text_content or obj.extracted_text or ""
-        return _build_snippet(source, terms)
+        source = obj.extracted_text or ""
+        return _build_snippet(source, terms, lowered=obj.extracted_text_normalized)
 
 
 class DocumentUploadSerializer(serializers.Serializer):
@@ -672,7 +503,7 @@ class DocumentViewSet(viewsets.GenericViewSet):
         qs = _apply_term_filters(qs, effective_terms, mode=effective_mode)
         if effective_exclude_terms:
             for term in effective_exclude_terms:
-                qs = qs.exclude(text_content_norm__icontains=term)
+                qs = qs.exclude(extracted_text_normalized__contains=term)
 
         return qs.order_by("-uploaded_at"), effective_terms
 
@@ -737,7 +568,7 @@ class DocumentViewSet(viewsets.GenericViewSet):
         force_ocr_raw = request.data.get("force_ocr", request.query_params.get("force_ocr", ""))
         force_ocr = str(force_ocr_raw).lower() in {"1", "true", "yes"}
 
-        if doc.status == DocumentStatus.PROCESSING:
+        if doc.is_processing():
             return Response({"id": str(doc.id), "status": doc.status}, status=status.HTTP_202_ACCEPTED)
 
         transaction.on_commit(
@@ -760,7 +591,8 @@ class DocumentViewSet(viewsets.GenericViewSet):
 
         docs = list(
             Document.objects.filter(owner=request.user, id__in=ids)
-            .exclude(status=DocumentStatus.PROCESSING)
+            .exclude(active_processing_q())
+            .only("id")
         )
 
         for doc in docs:
@@ -777,8 +609,7 @@ class DocumentViewSet(viewsets.GenericViewSet):
     @action(detail=True, methods=["get"], url_path="download-json")
     def download_json(self, request, pk=None):
         doc = self.get_object()
-        json_data = sanitize_payload(doc.extracted_json or {})
-        payload = json.dumps(json_data, ensure_ascii=False, indent=2)
+        payload = _encode_json_download(sanitize_payload(doc.extracted_json or {}))
         filename = _build_json_filename(doc)
         response = HttpResponse(payload, content_type="application/json")
         response["Content-Disposition"] = f'attachment; filename="{filename}"'
@@ -789,7 +620,7 @@ class DocumentViewSet(viewsets.GenericViewSet):
         doc = self.get_object()
         filename = doc.original_filename or os.path.basename(doc.file.name) or str(doc.id)
         try:
-            return FileResponse(doc.file.open("rb"), as_attachment=True, filename=filename)
+            return _attachment_response(doc.file.open("rb"), filename)
         except (FileNotFoundError, ValueError) as exc:
             raise NotFound("File not found.") from exc
 
@@ -801,34 +632,15 @@ class DocumentViewSet(viewsets.GenericViewSet):
 
         ids = list(dict.fromkeys(ids))[:MAX_BULK]
         docs = list(
-            Document.objects.filter(owner=request.user, id__in=ids)
+            Document.objects.filter(owner=request.user, id__in=ids, extracted_json__isnull=False)
+            .exclude(extracted_json={})
+            .only("id", "original_filename", "extracted_json")
             .order_by("-uploaded_at")
         )
-
-        buffer = io.BytesIO()
-        used_names = set()
-        added = 0
-
-        with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as zip_file:
-            for doc in docs:
-                if not doc.extracted_json:
-                    continue
-                json_data = sanitize_payload(doc.extracted_json or {})
-                payload = json.dumps(json_data, ensure_ascii=False, indent=2)
-                filename = _build_json_filename(doc)
-                if filename in used_names:
-                    base, ext = os.path.splitext(filename)
-                    filename = f"{base}-{str(doc.id)[:8]}{ext}"
-                used_names.add(filename)
-                zip_file.writestr(filename, payload)
-                added += 1
-
-        if added == 0:
+        if not docs:
             return Response({"detail": "No JSON available for download."}, status=status.HTTP_400_BAD_REQUEST)
 
-        buffer.seek(0)
-        response = HttpResponse(buffer.getvalue(), content_type="application/zip")
-        response["Content-Disposition"] = 'attachment; filename="documentos-json.zip"'
+        response = _zip_stream_response(_iter_json_zip_entries(docs), "documentos-json.zip")
         return response
 
     @action(detail=False, methods=["post"], url_path="bulk-download-files")
@@ -840,15 +652,16 @@ class DocumentViewSet(viewsets.GenericViewSet):
         ids = list(dict.fromkeys(ids))[:MAX_BULK]
         docs = list(
             Document.objects.filter(owner=request.user, id__in=ids)
+            .only("id", "original_filename", "file")
             .order_by("-uploaded_at")
         )
 
-        buffer = io.BytesIO()
+        buffer = _zip_buffer()
         used_names = set()
         added = 0
         missing = 0
 
-        with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as zip_file:
+        with _zip_file(buffer) as zip_file:
             for doc in docs:
                 if not doc.file or not doc.file.name:
                     missing += 1
@@ -858,7 +671,7 @@ class DocumentViewSet(viewsets.GenericViewSet):
                 filename = _unique_name(safe_name, used_names, str(doc.id)[:8])
                 try:
                     with doc.file.open("rb") as file_obj:
-                        with zip_file.open(filename, "w") as dest:
+                        with zip_file.open(_zip_entry(filename), "w") as dest:
                             for chunk in _iter_file_chunks(file_obj):
                                 dest.write(chunk)
                     added += 1
@@ -866,11 +679,10 @@ class DocumentViewSet(viewsets.GenericViewSet):
                     missing += 1
 
         if added == 0:
+            buffer.close()
             return Response({"detail": "No files available for download."}, status=status.HTTP_400_BAD_REQUEST)
 
-        buffer.seek(0)
-        response = HttpResponse(buffer.getvalue(), content_type="application/zip")
-        response["Content-Disposition"] = 'attachment; filename="documentos-arquivos.zip"'
+        response = _zip_response(buffer, "documentos-arquivos.zip")
         return response
 
 
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class DocumentsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "documents"
+
+    def ready(self):
+        # Load the PDF/OCR backends and compile the module regexes at startup
+        # instead of on the first upload.
+        from . import services  # noqa: F401
@@ -1,6 +1,7 @@
 import logging
 import re
-import unicodedata
+
+from .normalization import strip_accents
 
 logger = logging.getLogger(__name__)
 
@@ -24,6 +25,9 @@ FIELD_CHOICES = BASE_FIELD_CHOICES + [
 
 CPF_RE = re.compile(r"\b\d{3}\.\d{3}\.\d{3}-\d{2}\b|\b\d{11}\b")
 CNPJ_RE = re.compile(r"\b\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2}\b|\b\d{14}\b")
+_NON_DIGIT_RE = re.compile(r"\D")
+_SPACE_RUN_RE = re.compile(r"\s{2,}")
+_WHITESPACE_RE = re.compile(r"\s+")
 DOC_NUMBER_RE = re.compile(
     r"(?i)(nosso numero|numero do documento|documento)\D{0,10}([0-9A-Z/\.-]{4,})"
 )
@@ -145,16 +149,15 @@ DOC_NUMBER_LABEL_RES = [
 ]
 
 def _only_digits(value: str) -> str:
-    return re.sub(r"\D", "", value or "")
+    return _NON_DIGIT_RE.sub("", value or "")
 
 
 def _normalize_space(value: str) -> str:
-    return re.sub(r"\s{2,}", " ", value or "").strip()
+    return _SPACE_RUN_RE.sub(" ", value or "").strip()
 
 
 def _fold_text(value: str) -> str:
-    normalized = unicodedata.normalize("NFKD", value or "")
-    stripped = "".join(ch for ch in normalized if not unicodedata.combining(ch))
+    stripped = strip_accents(value)
     return stripped.replace("º", "o").replace("ª", "a").replace("°", "o")
 
 
@@ -232,11 +235,14 @@ def _collect_scoped_lines(text: str, anchors, window: int = 4):
         return []
     folded_lines = [_fold_text(line).lower() for line in lines]
     selected = []
+    covered = 0
     for idx, folded_line in enumerate(folded_lines):
         if any(anchor in folded_line for anchor in folded_anchors):
-            start = max(0, idx - window)
+            # Overlapping windows only add the lines not taken yet.
+            start = max(covered, idx - window)
             end = min(len(lines), idx + window + 1)
             selected.extend(lines[start:end])
+            covered = max(covered, end)
     return list(dict.fromkeys(selected))
 
 
@@ -404,7 +410,7 @@ def extract_payer_name(text: str) -> dict:
 
 def extract_document_number(text: str) -> dict:
     folded_text = _fold_text(text)
-    normalized_text = re.sub(r"\s+", " ", folded_text)
+    normalized_text = _WHITESPACE_RE.sub(" ", folded_text)
     for regex in DOC_NUMBER_LABEL_RES:
         match = regex.search(folded_text) or regex.search(normalized_text)
         if not match:
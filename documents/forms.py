@@ -1,9 +1,8 @@
-import re
-
 from django import forms
 
 from .models import FilterPreset
 from .services import _normalize_for_match
+from .view_helpers import TERM_SPLIT_RE
 
 
 VALUE_TYPE_CHOICES = [
@@ -115,9 +114,6 @@ class KeywordForm(forms.Form):
         return " ".join(value.split())
 
 
-TERM_SPLIT_RE = re.compile(r"[,\s]+")
-
-
 def _split_keywords(raw: str) -> list[str]:
     if not raw:
         return []
@@ -1,9 +1,9 @@
 from dataclasses import dataclass, field
 from difflib import SequenceMatcher
 import re
-import unicodedata
 
 from .intent_catalog import SYNONYM_MAP, TYPE_BY_BUILTIN
+from .normalization import strip_accents
 
 FUZZY_THRESHOLD = 0.84
 
@@ -20,8 +20,7 @@ class ResolvedIntent:
 
 def _normalize_label(value: str) -> str:
     raw = (value or "").strip().lower()
-    normalized = unicodedata.normalize("NFKD", raw)
-    stripped = "".join(ch for ch in normalized if not unicodedata.combining(ch))
+    stripped = strip_accents(raw)
     return re.sub(r"\s+", " ", stripped)
 
 
@@ -44,19 +44,29 @@ def update_payer_payee_fields(apps, schema_editor):
         keyword.field_key = field_map.get(keyword.field_key, keyword.field_key)
         keyword.save(update_fields=["field_key"])
 
+    def _remap(current):
+        seen = set()
+        deduped = []
+        changed = False
+        for value in current:
+            mapped = field_map.get(value, value)
+            changed |= mapped != value
+            if mapped not in seen:
+                seen.add(mapped)
+                deduped.append(mapped)
+        if changed or len(deduped) != len(current):
+            return deduped
+        return None
+
     for profile in ExtractionProfile.objects.all().iterator():
-        current = profile.enabled_fields or []
-        mapped = [field_map.get(value, value) for value in current]
-        deduped = list(dict.fromkeys(mapped))
-        if deduped != current:
+        deduped = _remap(profile.enabled_fields or [])
+        if deduped is not None:
             profile.enabled_fields = deduped
             profile.save(update_fields=["enabled_fields"])
 
     for doc in Document.objects.all().iterator():
-        current = doc.selected_fields or []
-        mapped = [field_map.get(value, value) for value in current]
-        deduped = list(dict.fromkeys(mapped))
-        if deduped != current:
+        deduped = _remap(doc.selected_fields or [])
+        if deduped is not None:
             doc.selected_fields = deduped
             doc.save(update_fields=["selected_fields"])
 
@@ -0,0 +1,61 @@
+import re
+import unicodedata
+
+from django.db import migrations
+
+
+TEXT_COLUMNS = ("extracted_text", "extracted_text_normalized")
+
+
+def _normalize_for_match(value: str) -> str:
+    normalized = unicodedata.normalize("NFKD", value or "")
+    stripped = "".join(ch for ch in normalized if not unicodedata.combining(ch))
+    return re.sub(r"\s+", " ", stripped).strip().lower()
+
+
+def merge_text_content(apps, schema_editor):
+    Document = apps.get_model("documents", "Document")
+    qs = Document.objects.filter(extracted_text="").exclude(text_content="")
+    for doc in qs.iterator():
+        doc.extracted_text = doc.text_content
+        doc.extracted_text_normalized = doc.text_content_norm or _normalize_for_match(doc.text_content)
+        doc.save(update_fields=["extracted_text", "extracted_text_normalized"])
+
+
+def set_text_compression(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != "postgresql" or connection.pg_version < 140000:
+        return
+    # lz4 is only offered when the server was built --with-lz4; otherwise
+    # the columns keep the default pglz compression.
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_settings WHERE name = 'default_toast_compression' AND 'lz4' = ANY(enumvals)"
+        )
+        if cursor.fetchone() is None:
+            return
+    table = schema_editor.quote_name(apps.get_model("documents", "Document")._meta.db_table)
+    for column in TEXT_COLUMNS:
+        schema_editor.execute(
+            f"ALTER TABLE {table} ALTER COLUMN {schema_editor.quote_name(column)} SET COMPRESSION lz4"
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("documents", "0015_filter_preset_exclude_terms"),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_text_content, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name="document",
+            name="text_content",
+        ),
+        migrations.RemoveField(
+            model_name="document",
+            name="text_content_norm",
+        ),
+        migrations.RunPython(set_text_compression, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("documents", "0016_document_drop_text_content"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="extractionkeyword",
+            name="normalized_label",
+            field=models.CharField(max_length=160),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("documents", "0019_document_owner_uploaded_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="document",
+            name="processing_started_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,13 +1,21 @@
 import re
-import unicodedata
 import uuid
+from datetime import timedelta
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.db.models import Q
 from django.utils import timezone
 
+from .normalization import strip_accents
+
 User = get_user_model()
 
+# A run still PROCESSING after the Celery hard time limit was killed (or its
+# worker died); such rows may be claimed again.
+PROCESSING_STALE_AFTER = timedelta(seconds=getattr(settings, "CELERY_TASK_TIME_LIMIT", 600) + 60)
+
 VALUE_TYPE_CHOICES = [
     ("text", "Texto"),
     ("block", "Bloco"),
@@ -41,6 +49,14 @@ class DocumentStatus(models.TextChoices):
     FAILED = "FAILED", "Falhou"
 
 
+def active_processing_q():
+    # Rows a live run is working on; stale PROCESSING rows are left out.
+    return Q(
+        status=DocumentStatus.PROCESSING,
+        processing_started_at__gte=timezone.now() - PROCESSING_STALE_AFTER,
+    )
+
+
 class ExtractionProfile(models.Model):
     owner = models.OneToOneField(User, on_delete=models.CASCADE, related_name="extraction_profile")
     enabled_fields = models.JSONField(default=list)
@@ -64,8 +80,7 @@ class ExtractionField(models.Model):
 
 def _normalize_keyword(value: str) -> str:
     raw = (value or "").strip().lower()
-    normalized = unicodedata.normalize("NFKD", raw)
-    stripped = "".join(ch for ch in normalized if not unicodedata.combining(ch))
+    stripped = strip_accents(raw)
     cleaned = re.sub(r"\s+", " ", stripped)
     return cleaned
 
@@ -90,7 +105,7 @@ class ExtractionKeyword(models.Model):
     anchors = models.JSONField(default=list)
     match_strategy = models.CharField(max_length=24, blank=True, default="")
     confidence = models.FloatField(default=0.0)
-    normalized_label = models.CharField(max_length=160, db_index=True)
+    normalized_label = models.CharField(max_length=160)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -137,6 +152,7 @@ class Document(models.Model):
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name="documents")
     uploaded_at = models.DateTimeField(auto_now_add=True)
     processed_at = models.DateTimeField(null=True, blank=True)
+    processing_started_at = models.DateTimeField(null=True, blank=True)
 
     status = models.CharField(
         max_length=16,
@@ -152,8 +168,6 @@ class Document(models.Model):
     extracted_json = models.JSONField(null=True, blank=True)
     extracted_text = models.TextField(blank=True, default="")
     extracted_text_normalized = models.TextField(blank=True, default="")
-    text_content = models.TextField(blank=True, default="")
-    text_content_norm = models.TextField(blank=True, default="")
     document_type = models.CharField(max_length=40, blank=True, default="")
     contact_phone = models.CharField(max_length=20, null=True, blank=True)
     extracted_age_years = models.PositiveSmallIntegerField(null=True, blank=True)
@@ -162,6 +176,17 @@ class Document(models.Model):
     text_quality = models.PositiveIntegerField(null=True, blank=True)
     error_message = models.TextField(blank=True, default="")
 
+    class Meta:
+        indexes = [models.Index(fields=["owner", "-uploaded_at"], name="doc_owner_uploaded_idx")]
+
+    @property
+    def text_content(self):
+        return self.extracted_text
+
+    @property
+    def text_content_norm(self):
+        return self.extracted_text_normalized
+
     def save(self, *args, **kwargs):
         if self.file and not self.stored_path:
             self.stored_path = self.file.name
@@ -170,10 +195,9 @@ class Document(models.Model):
     def mark_processing(self):
         self.status = DocumentStatus.PROCESSING
         self.processed_at = None
+        self.processing_started_at = timezone.now()
         self.extracted_text = ""
         self.extracted_text_normalized = ""
-        self.text_content = ""
-        self.text_content_norm = ""
         self.document_type = ""
         self.contact_phone = None
         self.extracted_age_years = None
@@ -183,6 +207,12 @@ class Document(models.Model):
         self.error_message = ""
         self.extracted_json = None
 
+    def is_processing(self) -> bool:
+        if self.status != DocumentStatus.PROCESSING:
+            return False
+        started_at = self.processing_started_at
+        return started_at is not None and started_at >= timezone.now() - PROCESSING_STALE_AFTER
+
     def mark_done(self, data: dict, *, extracted_text: str = "", ocr_used: bool = False, text_quality: int | None = None):
         self.extracted_json = data
         self.extracted_text = extracted_text if extracted_text is not None else ""
@@ -0,0 +1,19 @@
+import re
+import unicodedata
+from functools import lru_cache
+
+NON_ASCII_RUN_RE = re.compile(r"[^\x00-\x7f]+")
+
+
+@lru_cache(maxsize=1024)
+def _strip_run(run: str) -> str:
+    normalized = unicodedata.normalize("NFKD", run)
+    return "".join(ch for ch in normalized if not unicodedata.combining(ch))
+
+
+def strip_accents(value: str) -> str:
+    if not value or value.isascii():
+        return value or ""
+    # ASCII characters are NFKD boundaries, so only the accented runs need
+    # decomposing; the ASCII text between them is copied as is.
+    return NON_ASCII_RUN_RE.sub(lambda match: _strip_run(match.group()), value)
@@ -1,16 +1,24 @@
+import hashlib
+import json
 import logging
 import os
 import re
 import shutil
+import subprocess
+import tempfile
+import threading
 import time
-import unicodedata
+from functools import lru_cache, partial
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, datetime
 from decimal import Decimal, InvalidOperation
+from importlib import metadata
 
 from pypdf import PdfReader
 
 from .extractors import FIELD_EXTRACTORS, PAYER_SCOPE_ANCHORS, extract_cnpj, extract_cpf
 from .intent_catalog import TYPE_BY_BUILTIN
+from .normalization import strip_accents
 
 try:
     from pdf2image import convert_from_path
@@ -18,15 +26,46 @@ except ImportError:
     convert_from_path = None
 
 try:
-    import pytesseract
+    from PIL import Image
 except ImportError:
-    pytesseract = None
+    Image = None
 
+try:
+    import pypdfium2 as pdfium
+except ImportError:
+    pdfium = None
+
+try:
+    # _get_paddle_engine uses the 2.x API (use_angle_cls, show_log,
+    # ocr(cls=...)), which PaddleOCR 3 removed.
+    if int(metadata.version("paddleocr").split(".")[0]) >= 3:
+        raise ImportError("paddleocr 3.x is not supported")
+    from paddleocr import PaddleOCR
+except ImportError:
+    PaddleOCR = None
+
+try:
+    from tesserocr import PSM, PyTessBaseAPI
+except ImportError:
+    PSM = None
+    PyTessBaseAPI = None
+
+# The leading (?=\d) is redundant for matching but lets the engine skip
+# non-digit positions before evaluating \b.
 LINE_47_GROUP_RE = re.compile(
-    r"\b(\d{5})\.(\d{5})\s+(\d{5})\.(\d{6})\s+(\d{5})\.(\d{6})\s+(\d)\s+(\d{14})\b"
+    r"(?=\d)\b(\d{5})\.(\d{5})\s++(\d{5})\.(\d{6})\s++(\d{5})\.(\d{6})\s++(\d)\s++(\d{14})\b"
 )
-LINE_48_GROUP_RE = re.compile(r"\b(\d{12})[\s\.]+(\d{12})[\s\.]+(\d{12})[\s\.]+(\d{12})\b")
-LINE_CANDIDATE_RE = re.compile(r"(?:\d[\s\.\-]?){44,48}")
+LINE_48_GROUP_RE = re.compile(r"(?=\d)\b(\d{12})[\s\.]++(\d{12})[\s\.]++(\d{12})[\s\.]++(\d{12})\b")
+# One digit plus an optional separator: any whitespace except line breaks, so
+# a single pass over the whole text never joins digits across lines. Nothing
+# follows the repetitions, so they are possessive: a near-miss fails without
+# retrying every shorter split of the run.
+_LINE_ITEM = r"\d(?:[^\S\n\r\x0b\x0c\x1c-\x1e\x85\u2028\u2029]|[\.\-])?+"
+LINE_CANDIDATE_RE = re.compile(rf"(?:{_LINE_ITEM}){{44,48}}+")
+# Maximal runs of line items. Candidates never cross a run boundary, so
+# LINE_CANDIDATE_RE only has to look inside runs long enough to hold one
+# instead of retrying from every digit of every short number.
+LINE_DIGIT_RUN_RE = re.compile(rf"(?:{_LINE_ITEM})++")
 DATE_LABEL_RE = re.compile(
     r"(?i)(vencimento|vcto|vencto|data de vencimento)\D{0,20}([0-3]?\d[\./-][01]?\d[\./-](?:\d{4}|\d{2}))"
 )
@@ -36,18 +75,51 @@ EMISSAO_LABEL_RE = re.compile(
 AMOUNT_LABEL_RE = re.compile(
     r"(?i)(valor(?: do documento)?|valor cobrado|valor a pagar|total)\D{0,20}([0-9\.]+,[0-9]{2})"
 )
-GENERIC_AMOUNT_RE = re.compile(r"([0-9]{1,3}(?:\.[0-9]{3})*,[0-9]{2})")
+# Possessive for the same reason: a shorter digit or thousands group can only
+# be followed by another digit, never by the separator the pattern needs next.
+GENERIC_AMOUNT_RE = re.compile(r"([0-9]{1,3}+(?:\.[0-9]{3})*+,[0-9]{2})")
+# Whole lines (str.splitlines() boundaries) mentioning a payable amount.
+CONTEXT_AMOUNT_LINE_RE = re.compile(
+    r"(?i)(?:^|(?<=[\n\r\x0b\x0c\x1c-\x1e\x85\u2028\u2029]))"
+    r"[^\n\r\x0b\x0c\x1c-\x1e\x85\u2028\u2029]*?(?:valor|total|pagar|documento)"
+    r"[^\n\r\x0b\x0c\x1c-\x1e\x85\u2028\u2029]*"
+)
 GENERIC_DATE_RE = re.compile(r"\b([0-3]?\d[\./-][01]?\d[\./-](?:\d{4}|\d{2}))\b")
 GENERIC_ID_RE = re.compile(r"\b[0-9A-Z]{5,}\b")
 CEP_RE = re.compile(r"\b\d{5}-?\d{3}\b")
+_NON_DIGIT_RE = re.compile(r"\D")
+_NON_ALNUM_RE = re.compile(r"[^0-9A-Za-z]")
+_WHITESPACE_RE = re.compile(r"\s+")
+_WORD_RE = re.compile(r"\w+")
+_DATE_PARTS_RE = re.compile(r"([0-9]{1,2})[\./-]([0-9]{1,2})[\./-]([0-9]{4}|[0-9]{2})")
 JUROS_LABEL_RE = re.compile(r"(?i)(juros)\D{0,20}([0-9\.]+,[0-9]{2})")
 MULTA_LABEL_RE = re.compile(r"(?i)(multa)\D{0,20}([0-9\.]+,[0-9]{2})")
+CORE_LABEL_RES = (
+    ("vencimento", DATE_LABEL_RE),
+    ("emissao", EMISSAO_LABEL_RE),
+    ("valor", AMOUNT_LABEL_RE),
+    ("juros", JUROS_LABEL_RE),
+    ("multa", MULTA_LABEL_RE),
+)
+# Every label pattern wrapped in one zero-width lookahead: the scan visits
+# each position once and still reports the leftmost hit of every label, even
+# when two labels overlap. [dejmtv] holds the first letter of every label
+# alternative, so most positions are rejected by a single character test
+# before the five alternatives are tried.
+CORE_LABEL_SCAN_RE = re.compile(
+    "(?i)(?=[dejmtv])(?="
+    + "|".join(f"(?P<{name}>{regex.pattern.removeprefix('(?i)')})" for name, regex in CORE_LABEL_RES)
+    + ")"
+)
+CORE_LABEL_VALUE_GROUPS = {name: CORE_LABEL_SCAN_RE.groupindex[name] + 2 for name, _ in CORE_LABEL_RES}
 PHONE_CANDIDATE_RE = re.compile(r"(?:\+?\d[\d\-\.\(\)\s]{8,}\d)")
 DOB_RE = re.compile(
     r"(?i)(?:data\s+de\s+nascimento|nascimento|nasc\.?)\D{0,10}(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})"
 )
 AGE_INLINE_RE = re.compile(r"(?i)\b(\d{1,2})\s+anos?\s+de\s+idade\b")
 AGE_LABEL_RE = re.compile(r"(?i)\bidade\D{0,6}(\d{1,2})\b")
+AGE_YEARS_RE = re.compile(r"\b(\d{1,2})\s+anos?\b")
+DOB_SPLIT_RE = re.compile(r"[/-]")
 EXPERIENCE_RE = re.compile(r"(?i)\b(\d{1,2})\s+anos?\s+(?:de\s+)?experiencia\b")
 EXPERIENCE_LABEL_RE = re.compile(r"(?i)\bexperiencia\D{0,10}(\d{1,2})\s*anos?\b")
 EXPERIENCE_RANGE_RE = re.compile(
@@ -88,8 +160,16 @@ EXPERIENCE_SECTION_STOP_HEADERS = (
 logger = logging.getLogger(__name__)
 
 KEYWORD_PREFIX = "keyword:"
-CORE_FIELD_KEYS = {"due_date", "document_value", "barcode", "juros", "multa"}
-BUILTIN_FIELD_KEYS = set(TYPE_BY_BUILTIN.keys())
+CORE_FIELD_SOURCES = (
+    ("due_date", "dates", ("vencimento",)),
+    ("document_value", "amounts", ("valor_documento",)),
+    ("barcode", "barcode", ("codigo_barras", "linha_digitavel")),
+    ("juros", "amounts", ("juros",)),
+    ("multa", "amounts", ("multa",)),
+)
+CORE_FIELD_KEYS = frozenset(field_key for field_key, _, _ in CORE_FIELD_SOURCES)
+CORE_FIELD_LABELS = {"due_date": "vencimento", "document_value": "valor", "juros": "juros", "multa": "multa"}
+BUILTIN_FIELD_KEYS = frozenset(TYPE_BY_BUILTIN)
 
 ALIAS_FIELD_KEYS = {
     "cnpj": "payee_cnpj",
@@ -138,13 +218,42 @@ CUSTOM_STOP_PHRASES = (
     "cnpj",
 )
 
-OCR_TESSERACT_CONFIG = "--psm 6"
+OCR_TESSERACT_ARGS = ("--psm", "6", "-c", "tessedit_do_invert=0")
+OCR_DPI = int(os.getenv("OCR_DPI", "200"))
+OCR_USE_PDFTOCAIRO = os.getenv("OCR_USE_PDFTOCAIRO", "0") == "1"
+OCR_BINARIZE_THRESHOLD = int(os.getenv("OCR_BINARIZE_THRESHOLD", "180"))
+OCR_BINARIZE_TABLE = [255 if value > OCR_BINARIZE_THRESHOLD else 0 for value in range(256)]
+OCR_WORK_DIR = os.getenv("OCR_WORK_DIR") or None
+OCR_BACKEND = (os.getenv("OCR_BACKEND") or "tesseract").strip().lower()
+OCR_PADDLE_LANG = os.getenv("OCR_PADDLE_LANG", "pt")
+OCR_PADDLE_GPU = os.getenv("OCR_PADDLE_GPU", "1") == "1"
+
+_paddle_engine = None
+_paddle_engine_lock = threading.Lock()
+OCR_MAX_WORKERS = max(1, int(os.getenv("OCR_MAX_WORKERS") or os.cpu_count() or 1))
+OCR_BATCH_MAX_PAGES = 32
+
+
+NORMALIZE_CACHE_MAX_LEN = 512
+
+
+def _normalize_text(value: str) -> str:
+    stripped = strip_accents(value)
+    return _WHITESPACE_RE.sub(" ", stripped).strip().lower()
+
+
+# Lines, anchors and labels are normalized again for every custom keyword;
+# whole documents are left out so the cache never pins large texts. Callers
+# normalize a document's text once and pass it along instead.
+_normalize_short = lru_cache(maxsize=4096)(_normalize_text)
 
 
 def _normalize_for_match(value: str) -> str:
-    normalized = unicodedata.normalize("NFKD", value or "")
-    stripped = "".join(ch for ch in normalized if not unicodedata.combining(ch))
-    return re.sub(r"\s+", " ", stripped).strip().lower()
+    if not value:
+        return ""
+    if len(value) <= NORMALIZE_CACHE_MAX_LEN:
+        return _normalize_short(value)
+    return _normalize_text(value)
 
 
 _CUSTOM_STOP_NORMS = {_normalize_for_match(value) for value in CUSTOM_STOP_PHRASES}
@@ -198,8 +307,9 @@ def _extract_experience_section(text: str) -> str:
     return "\n".join(section_lines).strip()
 
 
-def _extract_experience_from_timeline(text: str) -> int | None:
-    normalized = _normalize_for_match(text)
+def _extract_experience_from_timeline(text: str, normalized: str | None = None) -> int | None:
+    if normalized is None:
+        normalized = _normalize_for_match(text)
     if not normalized:
         return None
     intervals = []
@@ -253,34 +363,43 @@ def _extract_experience_from_timeline(text: str) -> int | None:
     return _valid_years(total_years, min_value=0, max_value=60)
 
 
+# Country code (3) + leading "+" (1) + mobile (2); nothing later can beat it.
+PHONE_MAX_SCORE = 6
+
+
+def _normalize_phone_digits(raw_value: str) -> str | None:
+    digits = _NON_DIGIT_RE.sub("", raw_value or "")
+    if not digits:
+        return None
+    if digits.startswith("0") and len(digits) > 10:
+        digits = digits[1:]
+    if len(digits) > 11 and not digits.startswith("55"):
+        tail11 = digits[-11:]
+        tail10 = digits[-10:]
+        if len(tail11) == 11 and not tail11.startswith("0"):
+            digits = tail11
+        else:
+            digits = tail10
+    if digits.startswith("55") and len(digits) > 13:
+        tail = digits[-11:]
+        if len(tail) in {10, 11}:
+            digits = "55" + tail
+    return digits
+
+
 def extract_contact_phone(text: str) -> str | None:
     if not text:
         return None
 
-    def _normalize_phone_digits(raw_value: str) -> str | None:
-        digits = re.sub(r"\D", "", raw_value or "")
-        if not digits:
-            return None
-        if digits.startswith("0") and len(digits) > 10:
-            digits = digits[1:]
-        if len(digits) > 11 and not digits.startswith("55"):
-            tail11 = digits[-11:]
-            tail10 = digits[-10:]
-            if len(tail11) == 11 and not tail11.startswith("0"):
-                digits = tail11
-            else:
-                digits = tail10
-        if digits.startswith("55") and len(digits) > 13:
-            tail = digits[-11:]
-            if len(tail) in {10, 11}:
-                digits = "55" + tail
-        return digits
-
+    seen_raw = set()
     seen = set()
     best = None
     best_score = -1
     for match in PHONE_CANDIDATE_RE.finditer(text):
         raw = match.group(0)
+        if raw in seen_raw:
+            continue
+        seen_raw.add(raw)
         digits = _normalize_phone_digits(raw)
         if not digits:
             continue
@@ -304,6 +423,8 @@ def extract_contact_phone(text: str) -> str | None:
         if score > best_score:
             best_score = score
             best = digits
+            if score == PHONE_MAX_SCORE:
+                break
     if not best:
         return None
     if best.startswith("55"):
@@ -311,14 +432,19 @@ def extract_contact_phone(text: str) -> str | None:
     return f"55{best}"
 
 
-def extract_age_years(text: str) -> int | None:
+def extract_age_years(text: str, *, normalized: str | None = None) -> int | None:
     if not text:
         return None
-    normalized = _normalize_for_match(text)
-    match = DOB_RE.search(normalized)
+    if normalized is None:
+        normalized = _normalize_for_match(text)
+    # Every age pattern needs one of these words; most documents have none.
+    has_dob = "nasc" in normalized
+    if not has_dob and "idade" not in normalized:
+        return None
+    match = DOB_RE.search(normalized) if has_dob else None
     if match:
         raw = match.group(1)
-        parts = re.split(r"[/-]", raw)
+        parts = DOB_SPLIT_RE.split(raw)
         if len(parts) == 3:
             try:
                 day, month, year = (int(item) for item in parts)
@@ -346,7 +472,7 @@ def extract_age_years(text: str) -> int | None:
         if age_value is not None:
             return _valid_years(age_value)
 
-    for match in re.finditer(r"\b(\d{1,2})\s+anos?\b", normalized):
+    for match in AGE_YEARS_RE.finditer(normalized):
         window = normalized[max(0, match.start() - 20) : match.end() + 20]
         if "idade" not in window:
             continue
@@ -360,15 +486,17 @@ def extract_age_years(text: str) -> int | None:
     return None
 
 
-def extract_experience_years(text: str) -> int | None:
+def extract_experience_years(text: str, *, normalized: str | None = None) -> int | None:
     if not text:
         return None
     section_text = _extract_experience_section(text)
-    timeline_years = _extract_experience_from_timeline(section_text)
+    # The caller's normalized text only applies when no section was found.
+    if section_text is not text or normalized is None:
+        normalized = _normalize_for_match(section_text)
+    timeline_years = _extract_experience_from_timeline(section_text, normalized)
     if timeline_years is not None:
         return timeline_years
 
-    normalized = _normalize_for_match(section_text)
     match = EXPERIENCE_RANGE_RE.search(normalized)
     if match:
         try:
@@ -411,47 +539,46 @@ def _context_lines_for_type(inferred_type: str) -> int:
     return CONTEXT_LINES_BY_TYPE.get(inferred_type, CUSTOM_CONTEXT_LINES)
 
 
-def _collect_anchor_lines(text: str, anchors, context_lines: int):
-    anchors = [anchor for anchor in (anchors or []) if anchor]
-    if not anchors:
-        return []
-    norm_anchors = [_normalize_for_match(anchor) for anchor in anchors]
-    lines = [line.strip() for line in text.splitlines() if line.strip()]
-    norm_lines = [_normalize_for_match(line) for line in lines]
-    selected = []
-    for idx, norm_line in enumerate(norm_lines):
-        if any(anchor in norm_line for anchor in norm_anchors):
-            selected.append(lines[idx])
-            for offset in range(1, context_lines + 1):
-                if idx + offset < len(lines):
-                    selected.append(lines[idx + offset])
-    return list(dict.fromkeys(selected))
-
-
 def _split_lines(text: str) -> list[str]:
     return [line.strip() for line in text.splitlines() if line.strip()]
 
 
-def _find_anchor_indexes(lines, anchors) -> list[int]:
+def _index_lines(text: str) -> tuple[list[str], list[str]]:
+    lines = _split_lines(text)
+    return lines, [_normalize_for_match(line) for line in lines]
+
+
+def _find_anchor_indexes(norm_lines, anchors) -> list[int]:
     anchors = [anchor for anchor in (anchors or []) if anchor]
     if not anchors:
         return []
     norm_anchors = [_normalize_for_match(anchor) for anchor in anchors]
-    indexes = []
-    for idx, line in enumerate(lines):
-        norm_line = _normalize_for_match(line)
-        if any(anchor in norm_line for anchor in norm_anchors):
-            indexes.append(idx)
-    return indexes
+    return [idx for idx, norm_line in enumerate(norm_lines) if any(anchor in norm_line for anchor in norm_anchors)]
+
+
+@lru_cache(maxsize=1024)
+def _anchor_re(anchor: str):
+    return re.compile(re.escape(anchor), re.IGNORECASE)
+
+
+def _anchor_end(line: str, line_lower: str | None, anchor: str) -> int:
+    # Plain find on lowered text is only equivalent to IGNORECASE when both
+    # sides are ASCII (the regex also folds e.g. U+017F to "s").
+    if line_lower is not None and anchor.isascii():
+        pos = line_lower.find(anchor.lower())
+        return pos + len(anchor) if pos >= 0 else -1
+    match = _anchor_re(anchor).search(line)
+    return match.end() if match else -1
 
 
 def _extract_after_label(line: str, anchors):
     anchors = [anchor for anchor in (anchors or []) if anchor]
+    line_lower = line.lower() if line.isascii() else None
     for anchor in anchors:
-        match = re.search(re.escape(anchor), line, re.IGNORECASE)
-        if not match:
+        end = _anchor_end(line, line_lower, anchor)
+        if end < 0:
             continue
-        value = line[match.end():].strip(" :-\t")
+        value = line[end:].strip(" :-\t")
         if value:
             return value
     return None
@@ -534,15 +661,10 @@ def _log_custom_attempt(field_key, value_type, strategy, anchors, window_size, f
     )
 
 def _extract_text_from_lines(lines, anchors):
-    anchors = [anchor for anchor in (anchors or []) if anchor]
     for line in lines:
-        for anchor in anchors:
-            match = re.search(re.escape(anchor), line, re.IGNORECASE)
-            if not match:
-                continue
-            value = line[match.end():].strip(" :-\t")
-            if value:
-                return value
+        value = _extract_after_label(line, anchors)
+        if value:
+            return value
     return lines[0] if lines else None
 
 
@@ -561,20 +683,23 @@ def _looks_like_anchor(value_norm: str, anchors) -> bool:
 def _looks_like_label(value_norm: str) -> bool:
     if not value_norm:
         return True
-    for phrase in _CUSTOM_STOP_NORMS:
-        if not phrase:
-            continue
-        if value_norm == phrase:
-            return True
-        if value_norm.startswith(phrase) and len(value_norm) <= len(phrase) + 2:
-            return True
-    return False
+    # A stop phrase matches the value itself or the value minus up to two
+    # trailing characters, so three set lookups cover every phrase.
+    size = len(value_norm)
+    return any(value_norm[:end] in _CUSTOM_STOP_NORMS for end in range(size, max(size - 3, 0), -1))
+
+
+_ASCII_LETTERS = b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+_ASCII_DIGITS = b"0123456789"
 
 
 def _count_letters_digits(value: str) -> tuple[int, int]:
-    letters = sum(1 for ch in value if ch.isalpha())
-    digits = sum(1 for ch in value if ch.isdigit())
-    return letters, digits
+    if value.isascii():
+        # Deleting a byte class and comparing lengths counts it in C.
+        raw = value.encode("ascii")
+        size = len(raw)
+        return size - len(raw.translate(None, _ASCII_LETTERS)), size - len(raw.translate(None, _ASCII_DIGITS))
+    return sum(map(str.isalpha, value)), sum(map(str.isdigit, value))
 
 
 def _looks_like_amount_or_date(value: str) -> bool:
@@ -604,23 +729,20 @@ def _is_noise_value(value: str, anchors, inferred_type: str) -> bool:
         if digits >= letters and digits > 0:
             return True
     if inferred_type == "id":
-        compact = re.sub(r"[^0-9A-Za-z]", "", value)
+        compact = _NON_ALNUM_RE.sub("", value)
         if len(compact) < 4:
             return True
     return False
 
 
 def _extract_money_from_lines(lines):
-    candidates = []
-    for line in lines:
-        for match in GENERIC_AMOUNT_RE.findall(line):
-            amount = _parse_amount_decimal(match)
-            if amount is not None:
-                candidates.append(amount)
-    if not candidates:
+    best = max(
+        (_amount_cents(match) for line in lines for match in GENERIC_AMOUNT_RE.findall(line)),
+        default=None,
+    )
+    if best is None:
         return None
-    best = max(candidates)
-    return str(best.quantize(Decimal("0.01")))
+    return _format_cents(best)
 
 
 def _extract_date_from_lines(lines):
@@ -652,12 +774,21 @@ def _extract_postal_from_lines(lines):
 
 
 def _extract_barcode_from_text(text):
-    candidates = _extract_line_candidates(text)
-    line_digitavel, barcode = _select_barcode_and_line(candidates)
+    line_digitavel, barcode = _find_barcode_and_line(text)
     return line_digitavel or barcode
 
 
-def extract_custom(keyword_def: dict, text: str):
+@lru_cache(maxsize=256)
+def _custom_pattern_re(pattern: str):
+    # Invalid patterns are cached as None so they are not recompiled for
+    # every document.
+    try:
+        return re.compile(pattern, re.IGNORECASE)
+    except re.error:
+        return None
+
+
+def extract_custom(keyword_def: dict, text: str, line_index: tuple[list[str], list[str]] | None = None):
     anchors = keyword_def.get("anchors") or []
     label = (keyword_def.get("label") or "").strip()
     if not anchors and label:
@@ -673,8 +804,6 @@ def extract_custom(keyword_def: dict, text: str):
     if not isinstance(params, dict):
         params = {}
 
-    lines = _split_lines(text)
-    anchor_indexes = _find_anchor_indexes(lines, anchors)
     window_size = None
 
     if strategy == "regex":
@@ -682,11 +811,11 @@ def extract_custom(keyword_def: dict, text: str):
         if not pattern:
             _log_custom_attempt(keyword_def.get("keyword_key") or label, value_type, strategy, anchors, window_size, False)
             return None
-        try:
-            match = re.search(pattern, text, flags=re.IGNORECASE)
-        except re.error:
+        compiled = _custom_pattern_re(pattern)
+        if compiled is None:
             _log_custom_attempt(keyword_def.get("keyword_key") or label, value_type, strategy, anchors, window_size, False)
             return None
+        match = compiled.search(text)
         if not match:
             _log_custom_attempt(keyword_def.get("keyword_key") or label, value_type, strategy, anchors, window_size, False)
             return None
@@ -696,6 +825,8 @@ def extract_custom(keyword_def: dict, text: str):
         _log_custom_attempt(keyword_def.get("keyword_key") or label, value_type, strategy, anchors, window_size, bool(value))
         return value
 
+    lines, norm_lines = line_index or _index_lines(text)
+    anchor_indexes = _find_anchor_indexes(norm_lines, anchors)
     if not anchor_indexes:
         _log_custom_attempt(keyword_def.get("keyword_key") or label, value_type, strategy, anchors, window_size, False)
         return None
@@ -761,31 +892,32 @@ def extract_missing_with_llm(text: str, fields):
     return {}
 
 
-def classify_document_type(text: str):
+DOC_TYPE_SIGNALS = (
+    ("boleto", ("boleto", "linha digitavel", "codigo de barras")),
+    ("nota_fiscal", ("nota fiscal", "nf-e", "nfe", "danfe")),
+    ("fatura", ("fatura", "invoice")),
+    ("recibo", ("recibo",)),
+    (
+        "comprovante",
+        ("comprovante", "comprovacao", "comprovante de pagamento", "pix", "transferencia", "transacao"),
+    ),
+)
+
+
+def classify_document_type(text: str, barcode_pair: tuple | None = None, *, normalized: str | None = None):
     if not text:
         return None
 
-    candidates = _extract_line_candidates(text)
-    line_digitavel, barcode = _select_barcode_and_line(candidates)
+    line_digitavel, barcode = barcode_pair or _find_barcode_and_line(text)
     if line_digitavel or barcode:
         return "boleto"
 
-    normalized = _normalize_for_match(text)
+    if normalized is None:
+        normalized = _normalize_for_match(text)
     if not normalized:
         return None
 
-    doc_signals = [
-        ("boleto", ["boleto", "linha digitavel", "codigo de barras"]),
-        ("nota_fiscal", ["nota fiscal", "nf-e", "nfe", "danfe"]),
-        ("fatura", ["fatura", "invoice"]),
-        ("recibo", ["recibo"]),
-        (
-            "comprovante",
-            ["comprovante", "comprovacao", "comprovante de pagamento", "pix", "transferencia", "transacao"],
-        ),
-    ]
-
-    for doc_type, keywords in doc_signals:
+    for doc_type, keywords in DOC_TYPE_SIGNALS:
         if any(keyword in normalized for keyword in keywords):
             return doc_type
 
@@ -807,6 +939,19 @@ FORBIDDEN_PAYLOAD_KEYS = {
 }
 
 
+# (payload section, section key, field) for legacy nested payloads.
+PAYLOAD_SECTION_FIELDS = (
+    ("dates", "vencimento", "due_date"),
+    ("amounts", "valor_documento", "document_value"),
+    ("amounts", "juros", "juros"),
+    ("amounts", "multa", "multa"),
+)
+LEGACY_FIELD_KEYS = (
+    ("cnpj", "payee_cnpj"),
+    ("billing_address", "payer_address"),
+)
+
+
 def sanitize_payload(payload: dict) -> dict:
     if not isinstance(payload, dict):
         return {"document_type": None, "fields": {}, "custom_fields": {}}
@@ -824,19 +969,10 @@ def sanitize_payload(payload: dict) -> dict:
             if key in raw_fields:
                 fields[key] = raw_fields.get(key)
 
-    dates = payload.get("dates") or {}
-    if isinstance(dates, dict):
-        if "vencimento" in dates and "due_date" not in fields:
-            fields["due_date"] = dates.get("vencimento")
-
-    amounts = payload.get("amounts") or {}
-    if isinstance(amounts, dict):
-        if "valor_documento" in amounts and "document_value" not in fields:
-            fields["document_value"] = amounts.get("valor_documento")
-        if "juros" in amounts and "juros" not in fields:
-            fields["juros"] = amounts.get("juros")
-        if "multa" in amounts and "multa" not in fields:
-            fields["multa"] = amounts.get("multa")
+    for section, source_key, field_key in PAYLOAD_SECTION_FIELDS:
+        values = payload.get(section)
+        if isinstance(values, dict) and source_key in values and field_key not in fields:
+            fields[field_key] = values[source_key]
 
     barcode = payload.get("barcode") or {}
     if isinstance(barcode, dict) and "barcode" not in fields:
@@ -848,15 +984,9 @@ def sanitize_payload(payload: dict) -> dict:
         if key in payload and key not in fields:
             fields[key] = payload.get(key)
 
-    legacy_map = {
-        "cnpj": "payee_cnpj",
-        "billing_address": "payer_address",
-    }
-    for legacy_key, new_key in legacy_map.items():
-        if legacy_key in fields and new_key not in fields:
-            fields[new_key] = fields.get(legacy_key)
+    for legacy_key, new_key in LEGACY_FIELD_KEYS:
         if legacy_key in fields:
-            fields.pop(legacy_key, None)
+            fields.setdefault(new_key, fields.pop(legacy_key))
 
     custom_fields: dict[str, dict] = {}
     raw_custom = payload.get("custom_fields") or {}
@@ -879,19 +1009,19 @@ def _mask_log_value(value, inferred_type: str):
     safe_value = str(value).replace("\n", " ").strip()
     inferred_type = (inferred_type or "").lower()
     if inferred_type in {"cpf", "cnpj"}:
-        digits = re.sub(r"\D", "", safe_value)
+        digits = _NON_DIGIT_RE.sub("", safe_value)
         if len(digits) >= 4:
             return f"***{digits[-4:]}"
         return "***"
     if inferred_type == "barcode":
-        digits = re.sub(r"\D", "", safe_value)
+        digits = _NON_DIGIT_RE.sub("", safe_value)
         if len(digits) >= 6:
             return f"len={len(digits)} tail={digits[-6:]}"
         return f"len={len(digits)}"
     if inferred_type in {"text", "address", "block"}:
         return f"len={len(safe_value)}"
     if inferred_type == "id":
-        compact = re.sub(r"[^0-9A-Za-z]", "", safe_value)
+        compact = _NON_ALNUM_RE.sub("", safe_value)
         if len(compact) >= 4:
             return f"len={len(compact)} tail={compact[-4:]}"
         return f"len={len(compact)}"
@@ -900,22 +1030,32 @@ def _mask_log_value(value, inferred_type: str):
     return safe_value
 
 
-def _log_field_result(field: str, value, *, strategy: str, inferred_type: str = "", match_strategy: str = "", label: str = ""):
-    status = "extract_ok" if value not in (None, "") else "extract_missing"
-    safe_value = _mask_log_value(value, inferred_type) if status == "extract_ok" else "-"
-    logger.info(
-        "%s field=%s strategy=%s type=%s match=%s label=%s value=%s",
-        status,
-        field,
-        strategy,
-        inferred_type or "-",
-        match_strategy or "-",
-        label or "-",
-        safe_value,
-    )
+def _field_log_entry(value, *, strategy: str, inferred_type: str = "", match_strategy: str = "", label: str = "") -> dict:
+    found = value not in (None, "")
+    entry = {"status": "ok" if found else "missing", "strategy": strategy}
+    if inferred_type:
+        entry["type"] = inferred_type
+    if match_strategy:
+        entry["match"] = match_strategy
+    if label:
+        entry["label"] = label
+    if found:
+        entry["value"] = _mask_log_value(value, inferred_type)
+    return entry
 
 
 def _parse_date(value: str):
+    # Fast path for the dd/mm/yyyy shapes the date regexes capture; it
+    # mirrors strptime's rules, including the %y pivot at 68.
+    match = _DATE_PARTS_RE.fullmatch(value.strip())
+    if match:
+        day, month, year = (int(part) for part in match.groups())
+        if len(match.group(3)) == 2:
+            year += 2000 if year <= 68 else 1900
+        try:
+            return date(year, month, day).isoformat()
+        except ValueError:
+            return None
     cleaned = value.strip().replace("-", "/").replace(".", "/")
     for fmt in ("%d/%m/%Y", "%d/%m/%y"):
         try:
@@ -926,106 +1066,137 @@ def _parse_date(value: str):
 
 
 def _parse_amount(value: str):
-    cleaned = value.strip().replace(".", "").replace(",", ".")
+    cleaned = value.strip().replace(".", "")
+    whole, comma, cents = cleaned.rpartition(",")
+    digits = whole + cents
+    if comma and len(cents) == 2 and digits.isascii() and digits.isdigit():
+        return _format_cents(int(digits))
     try:
-        amount = Decimal(cleaned)
+        amount = Decimal(cleaned.replace(",", "."))
     except InvalidOperation:
         return None
     return str(amount.quantize(Decimal("0.01")))
 
 
-def _parse_amount_decimal(value: str):
-    cleaned = value.strip().replace(".", "").replace(",", ".")
-    try:
-        return Decimal(cleaned)
-    except InvalidOperation:
-        return None
+def _amount_cents(match: str) -> int:
+    # GENERIC_AMOUNT_RE only matches "1.234,56"-shaped ASCII amounts, so the
+    # digits alone are the value in cents.
+    return int(match.replace(".", "").replace(",", ""))
 
 
-def _extract_first(regex, text):
-    match = regex.search(text)
-    if not match:
-        return None
-    return match.group(2)
+def _format_cents(cents: int) -> str:
+    return f"{cents // 100}.{cents % 100:02d}"
 
 
-def _extract_amount(regex, text):
-    match = regex.search(text)
-    if not match:
-        return None
-    return _parse_amount(match.group(2))
+def _scan_core_labels(text: str, names=None) -> dict:
+    # Each label keeps its first hit, so the scan can stop as soon as every
+    # requested label has one.
+    wanted = CORE_LABEL_VALUE_GROUPS.keys() if names is None else names
+    remaining = len(wanted)
+    found = {}
+    if not remaining:
+        return found
+    for match in CORE_LABEL_SCAN_RE.finditer(text):
+        name = match.lastgroup
+        if name not in found:
+            found[name] = match.group(CORE_LABEL_VALUE_GROUPS[name])
+            if name in wanted:
+                remaining -= 1
+                if not remaining:
+                    break
+    return found
 
 
 def _extract_amount_by_context(text):
-    contextual = []
-    for line in text.splitlines():
-        lower = line.lower()
-        if any(term in lower for term in ("valor", "total", "a pagar", "pagar", "documento")):
-            for match in GENERIC_AMOUNT_RE.findall(line):
-                amount = _parse_amount_decimal(match)
-                if amount is not None:
-                    contextual.append(amount)
-    if contextual:
-        best = max(contextual)
-        return str(best.quantize(Decimal("0.01")))
-
-    candidates = []
-    for match in GENERIC_AMOUNT_RE.findall(text):
-        amount = _parse_amount_decimal(match)
-        if amount is not None:
-            candidates.append(amount)
-    if not candidates:
+    best = max(
+        (
+            _amount_cents(match)
+            for line_match in CONTEXT_AMOUNT_LINE_RE.finditer(text)
+            for match in GENERIC_AMOUNT_RE.findall(line_match.group(0))
+        ),
+        default=None,
+    )
+    if best is None:
+        best = max((_amount_cents(match) for match in GENERIC_AMOUNT_RE.findall(text)), default=None)
+    if best is None:
         return None
-    best = max(candidates)
-    return str(best.quantize(Decimal("0.01")))
-
-
-def _extract_line_candidates(text):
-    candidates = []
-    for match in LINE_47_GROUP_RE.findall(text):
-        digits = "".join(match)
-        if len(digits) == 47:
-            candidates.append(digits)
-    for match in LINE_48_GROUP_RE.findall(text):
-        digits = "".join(match)
-        if len(digits) == 48:
-            candidates.append(digits)
-    for line in text.splitlines():
-        for match in LINE_CANDIDATE_RE.findall(line):
-            digits = re.sub(r"\D", "", match)
-            if len(digits) in {44, 47, 48}:
-                candidates.append(digits)
-    return list(dict.fromkeys(candidates))
-
-
-def _select_barcode_and_line(candidates):
+    return _format_cents(best)
+
+
+def _line_digits(raw: str) -> str:
+    # Candidates are digits separated by spaces, dots or dashes; chained
+    # replace strips those in C and the regex only handles other whitespace.
+    digits = raw.replace(" ", "").replace(".", "").replace("-", "")
+    if digits.isdecimal():
+        return digits
+    return _NON_DIGIT_RE.sub("", raw)
+
+
+def _find_barcode_and_line(text):
     line_digitavel = None
     barcode = None
-    for cand in candidates:
-        if len(cand) in {47, 48} and not line_digitavel:
-            line_digitavel = cand
-        if len(cand) == 44 and not barcode:
-            barcode = cand
+    match = LINE_47_GROUP_RE.search(text) or LINE_48_GROUP_RE.search(text)
+    if match:
+        line_digitavel = "".join(match.groups())
+    for run in LINE_DIGIT_RUN_RE.finditer(text):
+        if run.end() - run.start() < 44:
+            continue
+        for match in LINE_CANDIDATE_RE.finditer(text, run.start(), run.end()):
+            digits = _line_digits(match.group(0))
+            if len(digits) in {47, 48} and not line_digitavel:
+                line_digitavel = digits
+            elif len(digits) == 44 and not barcode:
+                barcode = digits
+        if line_digitavel and barcode:
+            break
     return line_digitavel, barcode
 
 
+def _read_pdf_text_pdfium(file_path: str) -> str:
+    pdf = pdfium.PdfDocument(file_path)
+    try:
+        text_parts = []
+        for page in pdf:
+            textpage = page.get_textpage()
+            text_parts.append(textpage.get_text_range())
+            textpage.close()
+            page.close()
+    finally:
+        pdf.close()
+    return "\n".join(text_parts).replace("\r\n", "\n").strip()
+
+
 def _extract_text_from_pdf(file_path: str) -> str:
+    if pdfium is not None:
+        try:
+            return _read_pdf_text_pdfium(file_path)
+        except pdfium.PdfiumError as exc:
+            logger.warning(
+                "pdfium_failed file=%s error=%s fallback=pypdf",
+                os.path.basename(file_path),
+                exc,
+            )
     reader = PdfReader(file_path)
     text_parts = []
     for page in reader.pages:
         text_parts.append(page.extract_text() or "")
     return "\n".join(text_parts).strip()
 
+
 MIN_TEXT_CHARS = 200
 MIN_TEXT_WORDS = 30
 
 
+def _word_count(text: str) -> int:
+    return len(_WORD_RE.findall(text or ""))
+
+
 def _text_quality_stats(text: str) -> tuple[int, int]:
     stripped = (text or "").strip()
     if not stripped:
         return 0, 0
-    word_count = len(re.findall(r"\w+", stripped))
-    char_count = len(re.sub(r"\s+", "", stripped))
+    word_count = _word_count(stripped)
+    char_count = len(_WHITESPACE_RE.sub("", stripped))
     return word_count, char_count
 
 
@@ -1039,48 +1210,162 @@ def _missing_ocr_deps():
     missing = []
     if convert_from_path is None:
         missing.append("pdf2image")
-    if pytesseract is None:
-        missing.append("pytesseract")
-    if shutil.which("tesseract") is None:
+    if OCR_BACKEND == "paddle":
+        if PaddleOCR is None:
+            missing.append("paddleocr<3")
+    elif PyTessBaseAPI is None and shutil.which("tesseract") is None:
         missing.append("tesseract-ocr")
-    if shutil.which("pdftoppm") is None:
-        missing.append("poppler-utils (pdftoppm)")
+    renderer = "pdftocairo" if OCR_USE_PDFTOCAIRO else "pdftoppm"
+    if shutil.which(renderer) is None:
+        missing.append(f"poppler-utils ({renderer})")
     return missing
 
 
-def _extract_text_with_ocr(file_path: str) -> str:
-    missing = _missing_ocr_deps()
-    if missing:
-        raise RuntimeError("OCR nao disponivel. Instale: " + ", ".join(missing))
+def _run_tesseract(input_path: str, lang: str | None) -> str:
+    command = ["tesseract", input_path, "-", *OCR_TESSERACT_ARGS]
+    if lang:
+        command += ["-l", lang]
+    # Pages are already spread across OCR workers; tesseract's own OpenMP
+    # threads would only oversubscribe the cores.
+    env = {"OMP_THREAD_LIMIT": "1", **os.environ}
+    result = subprocess.run(command, capture_output=True, env=env, check=False)
+    if result.returncode != 0:
+        error = result.stderr.decode("utf-8", errors="replace").strip()
+        raise RuntimeError(f"tesseract falhou (codigo {result.returncode}): {error}")
+    return result.stdout.decode("utf-8", errors="replace")
+
+
+def _binarize_page(path: str) -> None:
+    # Typed boletos threshold cleanly; a 1-bit page skips tesseract's own
+    # Otsu pass and is much smaller to write and read back.
+    if Image is None:
+        return
+    with Image.open(path) as image:
+        page = image.convert("L").point(OCR_BINARIZE_TABLE, mode="1")
+    page.save(path, "PNG")
+
+
+def _ocr_batch_tesserocr(images: list, lang: str | None) -> str:
+    # One in-process API handle per batch: no tesseract fork, and the pages
+    # go from pdftoppm's output to the engine without touching disk.
+    text_parts = []
+    with PyTessBaseAPI(lang=lang or "eng", psm=PSM.SINGLE_BLOCK) as api:
+        api.SetVariable("tessedit_do_invert", "0")
+        for image in images:
+            api.SetImage(image.convert("L").point(OCR_BINARIZE_TABLE, mode="1"))
+            text_parts.append(api.GetUTF8Text())
+            image.close()
+    return "\n".join(text_parts)
+
+
+def _ocr_batch(paths: list[str], lang: str | None, workdir: str, index: int) -> str:
+    for path in paths:
+        _binarize_page(path)
+    # Tesseract accepts a text file listing one image per line and OCRs them
+    # all in a single process, so the engine and language data load once.
+    list_path = os.path.join(workdir, f"batch-{index}.txt")
+    with open(list_path, "w", encoding="utf-8") as handle:
+        handle.write("\n".join(paths) + "\n")
+    try:
+        return _run_tesseract(list_path, lang)
+    except Exception as exc:
+        logger.warning("ocr_batch_failed pages=%s error=%s fallback=per_page", len(paths), exc)
+        return "\n".join(_run_tesseract(path, lang) for path in paths)
+
+
+def _map_page_batches(pages: list, run_batch) -> list[str]:
+    workers = min(len(pages), OCR_MAX_WORKERS)
+    # Long image lists are known to stall tesseract, so big documents get
+    # more batches than workers rather than longer lists.
+    batch_count = max(workers, -(-len(pages) // OCR_BATCH_MAX_PAGES))
+    size = -(-len(pages) // batch_count)
+    batches = [pages[start : start + size] for start in range(0, len(pages), size)]
+    if len(batches) == 1:
+        return [run_batch(0, batches[0])]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(run_batch, range(len(batches)), batches))
+
+
+def _ocr_pages_tesseract(pages: list[str], lang: str | None, workdir: str) -> list[str]:
+    return _map_page_batches(pages, lambda index, batch: _ocr_batch(batch, lang, workdir, index))
+
+
+def _ocr_images_tesserocr(images: list, lang: str | None) -> list[str]:
+    return _map_page_batches(images, lambda index, batch: _ocr_batch_tesserocr(batch, lang))
+
 
+def _get_paddle_engine():
+    global _paddle_engine
+    if _paddle_engine is None:
+        _paddle_engine = PaddleOCR(
+            lang=OCR_PADDLE_LANG,
+            use_angle_cls=False,
+            use_gpu=OCR_PADDLE_GPU,
+            show_log=False,
+        )
+    return _paddle_engine
+
+
+def _ocr_pages_paddle(pages: list[str]) -> list[str]:
+    # The model is loaded once per worker process and kept on the device;
+    # calls are serialized because the predictor is not thread-safe.
+    text_parts = []
+    with _paddle_engine_lock:
+        engine = _get_paddle_engine()
+        for path in pages:
+            result = engine.ocr(path, cls=False) or []
+            lines = [line[1][0] for page in result if page for line in page]
+            text_parts.append("\n".join(lines))
+    return text_parts
+
+
+def _render_pages(file_path: str, output_folder: str | None = None) -> list:
     try:
-        images = convert_from_path(file_path, dpi=300)
+        pages = convert_from_path(
+            file_path,
+            dpi=OCR_DPI,
+            output_folder=output_folder,
+            fmt="png" if output_folder else "ppm",
+            grayscale=True,
+            paths_only=output_folder is not None,
+            thread_count=OCR_MAX_WORKERS,
+            use_pdftocairo=OCR_USE_PDFTOCAIRO,
+        )
     except Exception as exc:
         raise RuntimeError(f"OCR falhou ao converter PDF em imagens: {exc}") from exc
-
-    if not images:
+    if not pages:
         raise ValueError("OCR falhou: PDF sem paginas.")
+    return pages
+
+
+def _extract_text_with_ocr(file_path: str) -> str:
+    missing = _missing_ocr_deps()
+    if missing:
+        raise RuntimeError("OCR nao disponivel. Instale: " + ", ".join(missing))
 
     lang = os.getenv("OCR_LANG")
-    text_parts = []
-    for image in images:
-        if lang:
-            text_parts.append(
-                pytesseract.image_to_string(image, lang=lang, config=OCR_TESSERACT_CONFIG) or ""
-            )
-        else:
-            text_parts.append(pytesseract.image_to_string(image, config=OCR_TESSERACT_CONFIG) or "")
+    if OCR_BACKEND != "paddle" and PyTessBaseAPI is not None:
+        text_parts = _ocr_images_tesserocr(_render_pages(file_path), lang)
+    else:
+        with tempfile.TemporaryDirectory(prefix="ocr-", dir=OCR_WORK_DIR) as workdir:
+            pages = _render_pages(file_path, workdir)
+            if OCR_BACKEND == "paddle":
+                text_parts = _ocr_pages_paddle(pages)
+            else:
+                text_parts = _ocr_pages_tesseract(pages, lang, workdir)
     text = "\n".join(text_parts).strip()
     if not text:
         raise ValueError("OCR nao conseguiu extrair texto.")
     return text
 
 
-def extract_text_with_ocr_flag(file_path: str, *, force_ocr: bool = False) -> tuple[str, bool, int]:
+def extract_text_with_ocr_flag(file_path: str, *, force_ocr: bool = False, run_ocr=None) -> tuple[str, bool, int]:
+    if run_ocr is None:
+        run_ocr = partial(_extract_text_with_ocr, file_path)
     if force_ocr:
         logger.info("ocr_forced file=%s", os.path.basename(file_path))
-        ocr_text = _extract_text_with_ocr(file_path)
-        ocr_word_count, _ = _text_quality_stats(ocr_text)
+        ocr_text = run_ocr()
+        ocr_word_count = _word_count(ocr_text)
         return ocr_text, True, ocr_word_count
 
     extraction_error = None
@@ -1109,7 +1394,7 @@ def extract_text_with_ocr_flag(file_path: str, *, force_ocr: bool = False) -> tu
         word_count,
     )
     try:
-        ocr_text = _extract_text_with_ocr(file_path)
+        ocr_text = run_ocr()
     except Exception as exc:
         if text.strip():
             logger.warning(
@@ -1120,7 +1405,7 @@ def extract_text_with_ocr_flag(file_path: str, *, force_ocr: bool = False) -> tu
             return text, False, word_count
         logger.warning("ocr_failed file=%s error=%s", os.path.basename(file_path), exc)
         raise ValueError(f"PDF sem texto selecionavel. OCR falhou: {exc}") from exc
-    ocr_word_count, _ = _text_quality_stats(ocr_text)
+    ocr_word_count = _word_count(ocr_text)
     return ocr_text, True, ocr_word_count
 
 
@@ -1129,29 +1414,76 @@ def extract_text_from_pdf(file_path: str) -> str:
     return text
 
 
-def _extract_core(text: str) -> dict:
-    candidates = _extract_line_candidates(text)
-    line_digitavel, barcode = _select_barcode_and_line(candidates)
+def _extract_core(text: str, barcode_pair: tuple | None = None, fields=None) -> dict:
+    if barcode_pair is None and (fields is None or "barcode" in fields):
+        barcode_pair = _find_barcode_and_line(text)
+    line_digitavel, barcode = barcode_pair or (None, None)
 
-    vencimento = _parse_date(_extract_first(DATE_LABEL_RE, text) or "")
-    emissao = _parse_date(_extract_first(EMISSAO_LABEL_RE, text) or "")
+    names = None if fields is None else {CORE_FIELD_LABELS[field] for field in fields if field in CORE_FIELD_LABELS}
+    labels = _scan_core_labels(text, names)
+    vencimento = _parse_date(labels.get("vencimento") or "")
+    emissao = _parse_date(labels.get("emissao") or "")
 
-    valor = _extract_amount(AMOUNT_LABEL_RE, text)
-    if not valor:
+    valor = _parse_amount(labels["valor"]) if "valor" in labels else None
+    if not valor and (fields is None or "document_value" in fields):
         valor = _extract_amount_by_context(text)
 
-    juros = _extract_amount(JUROS_LABEL_RE, text)
-    multa = _extract_amount(MULTA_LABEL_RE, text)
+    juros = _parse_amount(labels["juros"]) if "juros" in labels else None
+    multa = _parse_amount(labels["multa"]) if "multa" in labels else None
 
     return {
-        "document_type": "boleto",
-        "raw_text_excerpt": text[:1200],
         "dates": {"vencimento": vencimento, "emissao": emissao},
         "amounts": {"valor_documento": valor, "juros": juros, "multa": multa},
         "barcode": {"linha_digitavel": line_digitavel, "codigo_barras": barcode},
     }
 
 
+# Bump when extraction or OCR output changes for the same file and settings.
+TEXT_EXTRACTION_VERSION = 1
+
+
+def _text_config_fingerprint() -> str:
+    # Everything that changes the text extracted from the same file; OCR_LANG
+    # is read per run, like _extract_text_with_ocr does.
+    config = (
+        TEXT_EXTRACTION_VERSION,
+        os.getenv("OCR_LANG") or "",
+        OCR_BACKEND,
+        OCR_DPI,
+        OCR_BINARIZE_THRESHOLD,
+        OCR_USE_PDFTOCAIRO,
+        OCR_TESSERACT_ARGS,
+        OCR_PADDLE_LANG,
+        MIN_TEXT_CHARS,
+        MIN_TEXT_WORDS,
+        pdfium is not None,
+        PyTessBaseAPI is not None,
+        PaddleOCR is not None,
+    )
+    return hashlib.sha256(repr(config).encode("utf-8")).hexdigest()[:16]
+
+
+def text_cache_key(content_hash: str) -> str:
+    return f"doctext:{_text_config_fingerprint()}:{content_hash}"
+
+
+def _cached_text(text_cache, key: str | None, extract, cacheable=None, refresh: bool = False):
+    # text_cache is any get/set cache (the task passes a Django cache keyed
+    # by the file's content hash and the extraction settings); extractions
+    # that raise are never stored, cacheable() can veto degraded results and
+    # refresh skips the read so the fresh result replaces the stored one.
+    if text_cache is None or not key:
+        return extract()
+    value = None if refresh else text_cache.get(key)
+    if value is None:
+        value = extract()
+        if cacheable is None or cacheable():
+            text_cache.set(key, value)
+    else:
+        logger.info("text_cache_hit key=%s", key)
+    return value
+
+
 def process_document(
     file_path: str,
     selected_fields=None,
@@ -1160,7 +1492,9 @@ def process_document(
     doc_id: str | None = None,
     filename: str | None = None,
     force_ocr: bool = False,
-) -> tuple[dict, str, bool, int]:
+    text_cache=None,
+    cache_key: str | None = None,
+) -> tuple[dict, str, str, bool, int]:
     if not file_path.lower().endswith(".pdf"):
         raise ValueError("Suporta apenas PDF.")
 
@@ -1170,8 +1504,40 @@ def process_document(
     selected_fields = list(dict.fromkeys(selected_fields))
     keyword_map = keyword_map or {}
 
-    text, ocr_used, text_quality = extract_text_with_ocr_flag(file_path, force_ocr=force_ocr)
+    ocr_failed = False
+
+    def _ocr_text():
+        # Full-document OCR is cached on its own, so the weak text fallback
+        # and the payer retry below share one result; a forced run always
+        # runs OCR again and refreshes the stored result.
+        nonlocal ocr_failed
+        try:
+            return _cached_text(
+                text_cache,
+                cache_key and f"{cache_key}:ocr",
+                lambda: _extract_text_with_ocr(file_path),
+                refresh=force_ocr,
+            )
+        except Exception:
+            ocr_failed = True
+            raise
+
+    if force_ocr:
+        text, ocr_used, text_quality = extract_text_with_ocr_flag(file_path, force_ocr=True, run_ocr=_ocr_text)
+    else:
+        # When OCR failed and the weak PDF text was kept, the result is not
+        # cached so the next run retries OCR.
+        text, ocr_used, text_quality = _cached_text(
+            text_cache,
+            cache_key and f"{cache_key}:text",
+            lambda: extract_text_with_ocr_flag(file_path, run_ocr=_ocr_text),
+            cacheable=lambda: not ocr_failed,
+        )
+    # Normalized once here for classification and returned for the search
+    # index and the age/experience extractors.
+    normalized = _normalize_for_match(text)
     storage_text = text
+    storage_normalized = normalized
     storage_quality = text_quality
     file_label = filename or os.path.basename(file_path)
     logger.info(
@@ -1183,8 +1549,10 @@ def process_document(
         force_ocr,
     )
 
+    # Classification and the core fields both need the boleto line/barcode.
+    barcode_pair = _find_barcode_and_line(text)
     payload = {
-        "document_type": classify_document_type(text) or None,
+        "document_type": classify_document_type(text, barcode_pair, normalized=normalized) or None,
         "fields": {},
         "custom_fields": {},
     }
@@ -1194,12 +1562,21 @@ def process_document(
     resolved_fields = []
     raw_fields_by_builtin = {}
     custom_definitions = []
+    # Field results are collected and logged once per document; a field
+    # retried after OCR keeps its final result.
+    log_fields = logger.isEnabledFor(logging.INFO)
+    field_results = {}
+
+    def _record_field(field: str, value, **details):
+        if log_fields:
+            field_results[field] = _field_log_entry(value, **details)
+
     for field in selected_fields:
         if field.startswith(KEYWORD_PREFIX):
             info = keyword_map.get(field) or {}
             if not info:
                 missing_fields.append(field)
-                _log_field_result(field, None, strategy="keyword")
+                _record_field(field, None, strategy="keyword")
                 continue
             resolved_kind = (info.get("resolved_kind") or "custom").lower()
             field_key = info.get("field_key") or ""
@@ -1218,8 +1595,9 @@ def process_document(
     resolved_fields = list(dict.fromkeys(resolved_fields))
 
     core = None
-    if any(field in CORE_FIELD_KEYS for field in resolved_fields):
-        core = _extract_core(text)
+    core_fields = [field for field in resolved_fields if field in CORE_FIELD_KEYS]
+    if core_fields:
+        core = _extract_core(text, barcode_pair, core_fields)
 
     def _mark_missing_builtin(field_key: str):
         missing_resolved_fields.append(field_key)
@@ -1234,6 +1612,8 @@ def process_document(
             )
 
     def _log_builtin_field(field_key: str, value):
+        if not log_fields:
+            return
         inferred_type = TYPE_BY_BUILTIN.get(field_key, "")
         raw_fields = raw_fields_by_builtin.get(field_key) or [field_key]
         for raw_field in raw_fields:
@@ -1241,7 +1621,7 @@ def process_document(
                 info = keyword_map.get(raw_field) or {}
                 label = info.get("label") or ""
                 match_strategy = info.get("match_strategy") or ""
-                _log_field_result(
+                _record_field(
                     raw_field,
                     value,
                     strategy="builtin",
@@ -1250,72 +1630,52 @@ def process_document(
                     label=label,
                 )
             else:
-                _log_field_result(
+                _record_field(
                     field_key,
                     value,
                     strategy="builtin",
                     inferred_type=inferred_type,
                 )
 
-    if "due_date" in resolved_fields:
-        due_date = core["dates"].get("vencimento") if core else None
-        payload["fields"]["due_date"] = due_date if due_date else None
-        if not due_date:
-            _mark_missing_builtin("due_date")
-        _log_builtin_field("due_date", due_date)
-
-    if "document_value" in resolved_fields:
-        value = core["amounts"].get("valor_documento") if core else None
-        payload["fields"]["document_value"] = value if value else None
-        if not value:
-            _mark_missing_builtin("document_value")
-        _log_builtin_field("document_value", value)
-
-    if "barcode" in resolved_fields:
-        barcode = core.get("barcode") if core else None
-        barcode_value = (barcode or {}).get("codigo_barras") or (barcode or {}).get("linha_digitavel")
-        payload["fields"]["barcode"] = barcode_value if barcode_value else None
-        if not (barcode and (barcode.get("linha_digitavel") or barcode.get("codigo_barras"))):
-            _mark_missing_builtin("barcode")
-        _log_builtin_field("barcode", barcode_value)
-
-    if "juros" in resolved_fields:
-        juros = core["amounts"].get("juros") if core else None
-        payload["fields"]["juros"] = juros if juros else None
-        if not juros:
-            _mark_missing_builtin("juros")
-        _log_builtin_field("juros", juros)
-
-    if "multa" in resolved_fields:
-        multa = core["amounts"].get("multa") if core else None
-        payload["fields"]["multa"] = multa if multa else None
-        if not multa:
-            _mark_missing_builtin("multa")
-        _log_builtin_field("multa", multa)
-
-    for field in resolved_fields:
-        if field in CORE_FIELD_KEYS:
+    payload_fields = payload["fields"]
+    resolved_set = set(resolved_fields)
+    for field_key, section, keys in CORE_FIELD_SOURCES:
+        if field_key not in resolved_set:
             continue
-        extractor = FIELD_EXTRACTORS.get(field)
+        section_values = core[section]
+        value = None
+        for key in keys:
+            value = section_values.get(key)
+            if value:
+                break
+        payload_fields[field_key] = value if value else None
+        if not value:
+            _mark_missing_builtin(field_key)
+        _log_builtin_field(field_key, value)
+
+    field_extractors = [
+        (field, FIELD_EXTRACTORS.get(field)) for field in resolved_fields if field not in CORE_FIELD_KEYS
+    ]
+    for field, extractor in field_extractors:
         if not extractor:
             _mark_missing_builtin(field)
-            payload["fields"][field] = None
+            payload_fields[field] = None
             _log_builtin_field(field, None)
             continue
         piece = extractor(text)
         if not piece:
             _mark_missing_builtin(field)
-            payload["fields"][field] = None
+            payload_fields[field] = None
             _log_builtin_field(field, None)
             continue
         value = piece.get(field)
-        payload["fields"][field] = value if value else None
+        payload_fields[field] = value if value else None
         _log_builtin_field(field, value)
 
-    payer_missing = [field for field in missing_resolved_fields if field.startswith("payer_")]
-    if payer_missing and not ocr_used:
+    payer_missing = [] if ocr_used else [field for field in missing_resolved_fields if field.startswith("payer_")]
+    if payer_missing:
         try:
-            ocr_text = _extract_text_with_ocr(file_path)
+            ocr_text = _ocr_text()
         except Exception as exc:
             logger.warning(
                 "ocr_on_demand_failed doc=%s file=%s fields=%s error=%s",
@@ -1327,7 +1687,8 @@ def process_document(
         else:
             ocr_used = True
             storage_text = ocr_text
-            storage_quality = _text_quality_stats(ocr_text)[0]
+            storage_normalized = _normalize_for_match(ocr_text)
+            storage_quality = _word_count(ocr_text)
             logger.info(
                 "ocr_on_demand doc=%s file=%s fields=%s",
                 doc_id or "-",
@@ -1359,20 +1720,22 @@ def process_document(
                     )
                     _log_builtin_field(field, None)
 
+    # Split and normalize the lines once for every custom keyword.
+    line_index = _index_lines(text) if custom_definitions else None
     for info in custom_definitions:
         keyword_key = info.get("keyword_key") or ""
         label = (info.get("label") or "").strip()
         inferred_type = info.get("inferred_type") or "text"
         value_type = info.get("value_type") or inferred_type
         match_strategy = info.get("match_strategy") or ""
-        value = extract_custom(info, text)
+        value = extract_custom(info, text, line_index)
         field_key = keyword_key or label or inferred_type
         payload["custom_fields"][field_key] = {
             "label": label or field_key,
             "value": value if value else None,
         }
         if value:
-            _log_field_result(
+            _record_field(
                 field_key,
                 value,
                 strategy="custom",
@@ -1382,7 +1745,7 @@ def process_document(
             )
         else:
             missing_fields.append(field_key)
-            _log_field_result(
+            _record_field(
                 field_key,
                 None,
                 strategy="custom",
@@ -1391,6 +1754,13 @@ def process_document(
                 label=label,
             )
 
+    if field_results:
+        logger.info(
+            "extract_fields doc=%s file=%s results=%s",
+            doc_id or "-",
+            file_label,
+            json.dumps(field_results, ensure_ascii=False),
+        )
     missing_fields = list(dict.fromkeys(missing_fields))
     missing_resolved = list(dict.fromkeys(missing_resolved_fields))
     elapsed_ms = int((time.monotonic() - started_at) * 1000)
@@ -1404,4 +1774,4 @@ def process_document(
         resolved_fields,
         ocr_used,
     )
-    return sanitize_payload(payload), storage_text, ocr_used, storage_quality
+    return sanitize_payload(payload), storage_text, storage_normalized, ocr_used, storage_quality
@@ -1,26 +1,31 @@
+import hashlib
 import logging
 import os
 import tempfile
 
 from celery import shared_task
+from django.core.cache import caches
 from django.db import transaction
 from django.utils import timezone
 
-from .models import Document, DocumentStatus
+from .models import Document, DocumentStatus, active_processing_q
 from .processing import apply_extracted_fields, get_keyword_map
-from .services import process_document
+from .services import process_document, text_cache_key
 
 logger = logging.getLogger(__name__)
 
-PROCESSING_UPDATE_FIELDS = [
+PROCESSING_START_FIELDS = [
     "status",
     "processed_at",
+    "processing_started_at",
     "error_message",
+]
+# Reset by mark_processing but only written when a run fails: a successful
+# run overwrites all of them through apply_extracted_fields and mark_done.
+EXTRACTED_RESULT_FIELDS = [
     "extracted_json",
     "extracted_text",
     "extracted_text_normalized",
-    "text_content",
-    "text_content_norm",
     "document_type",
     "contact_phone",
     "extracted_age_years",
@@ -43,11 +48,24 @@ def _iter_file_chunks(file_obj, chunk_size=1024 * 1024):
         yield chunk
 
 
+def _processing_values(fields):
+    template = Document()
+    template.mark_processing()
+    return {field: getattr(template, field) for field in fields}
+
+
+def _file_sha256(file_path):
+    with open(file_path, "rb") as handle:
+        return hashlib.file_digest(handle, "sha256").hexdigest()
+
+
 def _prepare_document_file(doc):
     try:
-        return doc.file.path, None
+        file_path = doc.file.path
     except (AttributeError, NotImplementedError, ValueError):
         pass
+    else:
+        return file_path, None, _file_sha256(file_path)
 
     if not doc.file or not doc.file.name:
         raise FileNotFoundError("document file not available")
@@ -55,11 +73,14 @@ def _prepare_document_file(doc):
     file_name = doc.file.name
     suffix = os.path.splitext(file_name)[1]
     tmp_path = None
+    hasher = hashlib.sha256()
     file_obj = doc.file.storage.open(file_name, "rb")
     try:
+        # Hash while copying so remote files are only downloaded once.
         with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp_file:
             tmp_path = tmp_file.name
             for chunk in _iter_file_chunks(file_obj):
+                hasher.update(chunk)
                 tmp_file.write(chunk)
     except Exception:
         if tmp_path:
@@ -77,48 +98,56 @@ def _prepare_document_file(doc):
         except FileNotFoundError:
             pass
 
-    return tmp_path, _cleanup
+    return tmp_path, _cleanup, hasher.hexdigest()
 
 
 @shared_task(bind=True, autoretry_for=(Exception,), retry_backoff=True, max_retries=3)
 def process_document_task(self, doc_id, *, force=False, force_ocr=False):
-    try:
-        with transaction.atomic():
-            doc = Document.objects.select_for_update().get(id=doc_id)
-
-            if doc.status == DocumentStatus.PROCESSING:
-                logger.info("task_skip doc=%s reason=already_processing", doc_id)
-                return {"skipped": True, "reason": "already_processing"}
-
-            if doc.status == DocumentStatus.DONE and not force:
-                logger.info("task_skip doc=%s reason=already_done", doc_id)
-                return {"skipped": True, "reason": "already_done"}
-
-            doc.mark_processing()
-            doc.save(update_fields=PROCESSING_UPDATE_FIELDS)
+    # Claim the document with one conditional UPDATE instead of locking the
+    # row, re-checking its status and saving it. A row left PROCESSING by a
+    # killed run (hard time limit, dead worker) is claimed again once stale.
+    claim = Document.objects.filter(id=doc_id).exclude(active_processing_q())
+    if not force:
+        claim = claim.exclude(status=DocumentStatus.DONE)
+    claimed = claim.update(**_processing_values(PROCESSING_START_FIELDS))
+    if not claimed:
+        status = Document.objects.filter(id=doc_id).values_list("status", flat=True).first()
+        if status is None:
+            logger.warning("task_skip doc=%s reason=missing", doc_id)
+            return {"skipped": True, "reason": "missing"}
+        reason = "already_processing" if status == DocumentStatus.PROCESSING else "already_done"
+        logger.info("task_skip doc=%s reason=%s", doc_id, reason)
+        return {"skipped": True, "reason": reason}
 
-            selected_fields = doc.selected_fields or []
-            owner_id = doc.owner_id
-            filename = doc.original_filename
+    try:
+        doc = Document.objects.only("id", "owner_id", "file", "original_filename", "selected_fields").get(id=doc_id)
     except Document.DoesNotExist:
         logger.warning("task_skip doc=%s reason=missing", doc_id)
         return {"skipped": True, "reason": "missing"}
+    selected_fields = doc.selected_fields or []
+    owner_id = doc.owner_id
+    filename = doc.original_filename
 
     cleanup = None
     try:
-        file_path, cleanup = _prepare_document_file(doc)
+        file_path, cleanup, content_hash = _prepare_document_file(doc)
         keyword_map = get_keyword_map(owner_id, selected_fields)
-        data, extracted_text, ocr_used, text_quality = process_document(
+        # Re-runs with a new field selection reuse the text (and OCR) of the
+        # same file content instead of extracting it again.
+        data, extracted_text, normalized_text, ocr_used, text_quality = process_document(
             file_path,
             selected_fields,
             keyword_map=keyword_map,
             doc_id=str(doc_id),
             filename=filename,
             force_ocr=force_ocr,
+            text_cache=caches["document_text"],
+            cache_key=text_cache_key(content_hash),
         )
     except Exception as exc:
         with transaction.atomic():
             updated = Document.objects.filter(id=doc_id).update(
+                **_processing_values(EXTRACTED_RESULT_FIELDS),
                 status=DocumentStatus.FAILED,
                 processed_at=timezone.now(),
                 error_message=(str(exc) or "")[:5000],
@@ -132,20 +161,20 @@ def process_document_task(self, doc_id, *, force=False, force_ocr=False):
         if cleanup:
             cleanup()
 
-    with transaction.atomic():
-        try:
-            doc = Document.objects.select_for_update().get(id=doc_id)
-        except Document.DoesNotExist:
-            logger.warning("process_done doc=%s reason=missing", doc_id)
-            return {"skipped": True, "reason": "missing"}
-        apply_extracted_fields(doc, extracted_text, data)
-        doc.mark_done(
-            data,
-            extracted_text=extracted_text,
-            ocr_used=ocr_used,
-            text_quality=text_quality,
-        )
-        doc.save()
-        logger.info("process_done doc=%s task=%s", doc_id, getattr(self.request, "id", "-"))
+    result = Document()
+    apply_extracted_fields(result, extracted_text, data, normalized=normalized_text)
+    result.mark_done(
+        data,
+        extracted_text=extracted_text,
+        ocr_used=ocr_used,
+        text_quality=text_quality,
+    )
+    updated = Document.objects.filter(id=doc_id).update(
+        **{field: getattr(result, field) for field in PROCESSING_START_FIELDS + EXTRACTED_RESULT_FIELDS}
+    )
+    if not updated:
+        logger.warning("process_done doc=%s reason=missing", doc_id)
+        return {"skipped": True, "reason": "missing"}
+    logger.info("process_done doc=%s task=%s", doc_id, getattr(self.request, "id", "-"))
 
     return {"ok": True}
@@ -0,0 +1,424 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+import time
+import zipfile
+from collections import deque
+
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils.functional import cached_property
+from django.utils.text import get_valid_filename
+
+from .models import Document, ExtractionField, ExtractionKeyword, ExtractionProfile, FilterPreset
+from .services import KEYWORD_PREFIX, _normalize_for_match, sanitize_payload
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+MAX_BULK = 25
+SEARCH_COUNT_CACHE_SECONDS = 30
+EXTRACTION_FIELDS_CACHE_KEY = "extraction_fields_v1"
+EXTRACTION_FIELDS_CACHE_SECONDS = 300
+# FileResponse's 4 KiB default means one iteration (or sendfile call) per page.
+DOWNLOAD_BLOCK_SIZE = 64 * 1024
+ZIP_SPOOL_MAX_BYTES = 8 * 1024 * 1024
+# Level 1 deflates JSON text about twice as fast as the default 6 for a
+# slightly larger archive.
+ZIP_COMPRESS_LEVEL = int(os.getenv("ZIP_COMPRESS_LEVEL", "1"))
+# Already compressed; deflating them again only burns CPU.
+ZIP_STORED_EXTENSIONS = {".pdf", ".jpg", ".jpeg", ".png", ".docx", ".xlsx", ".zip", ".gz"}
+SEARCH_SNIPPET_LEN = 120
+JSON_DOWNLOAD_ENCODER = json.JSONEncoder(ensure_ascii=False, indent=2)
+ORJSON_DOWNLOAD_OPTIONS = orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS if orjson is not None else 0
+
+TERM_SPLIT_RE = re.compile(r"[,\s]+")
+
+REMOVE_SELECTED_FIELD_SQL = """
+UPDATE {table}
+SET selected_fields = COALESCE(
+    (
+        SELECT jsonb_agg(item.value ORDER BY item.position)
+        FROM jsonb_array_elements(selected_fields) WITH ORDINALITY AS item(value, position)
+        WHERE item.value <> to_jsonb(%s::text)
+    ),
+    '[]'::jsonb
+)
+WHERE owner_id = %s AND selected_fields ? %s
+"""
+
+
+class CachedCountPaginator(Paginator):
+    # Text searches make COUNT(*) as expensive as the page query itself, so
+    # their result count is reused for a short while across page changes.
+    def __init__(self, object_list, per_page, *, count_key: str = "", **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_key = count_key
+
+    @cached_property
+    def count(self):
+        if not self.count_key:
+            return Paginator.count.func(self)
+        value = cache.get(self.count_key)
+        if value is None:
+            value = Paginator.count.func(self)
+            cache.set(self.count_key, value, SEARCH_COUNT_CACHE_SECONDS)
+        return value
+
+
+def _search_count_key(user_id, querystring: str) -> str:
+    digest = hashlib.sha1(querystring.encode("utf-8")).hexdigest()
+    return f"doclist-count:{user_id}:{digest}"
+
+
+def _split_terms(raw: str) -> list[str]:
+    if not raw:
+        return []
+    if ";" in raw:
+        parts = [term.strip() for term in raw.split(";") if term.strip()]
+    else:
+        # Same terms as TERM_SPLIT_RE.split, without the regex or the strip
+        # pass: str.split() already drops empty and whitespace-only pieces.
+        parts = raw.replace(",", " ").split()
+    normalized_terms = []
+    seen = set()
+    for term in parts:
+        normalized = _normalize_for_match(term)
+        if not normalized or normalized in seen:
+            continue
+        seen.add(normalized)
+        normalized_terms.append(normalized)
+    return normalized_terms
+
+
+def _apply_term_filters(queryset, terms: list[str], *, mode: str = "all", field: str = "extracted_text_normalized"):
+    if not terms:
+        return queryset
+    # Terms and the normalized column are both lowercased by
+    # _normalize_for_match, so a plain LIKE matches and can use the trigram
+    # index instead of UPPER() on every row.
+    if mode == "any":
+        query = Q()
+        for term in terms:
+            query |= Q(**{f"{field}__contains": term})
+        return queryset.filter(query)
+    for term in terms:
+        queryset = queryset.filter(**{f"{field}__contains": term})
+    return queryset
+
+
+def _apply_preset_filters(
+    queryset,
+    preset: FilterPreset,
+    *,
+    experience_min_years: int | None = None,
+    experience_max_years: int | None = None,
+    age_min_years: int | None = None,
+    age_max_years: int | None = None,
+    exclude_unknowns: bool | None = None,
+):
+    if not preset:
+        return queryset
+    if experience_min_years is None:
+        experience_min_years = preset.experience_min_years
+    if experience_max_years is None:
+        experience_max_years = preset.experience_max_years
+    if age_min_years is None:
+        age_min_years = preset.age_min_years
+    if age_max_years is None:
+        age_max_years = preset.age_max_years
+    if exclude_unknowns is None:
+        exclude_unknowns = preset.exclude_unknowns
+    if experience_min_years is not None:
+        if exclude_unknowns:
+            queryset = queryset.filter(extracted_experience_years__gte=experience_min_years)
+        else:
+            queryset = queryset.filter(
+                Q(extracted_experience_years__isnull=True)
+                | Q(extracted_experience_years__gte=experience_min_years)
+            )
+    if experience_max_years is not None:
+        if exclude_unknowns:
+            queryset = queryset.filter(extracted_experience_years__lte=experience_max_years)
+        else:
+            queryset = queryset.filter(
+                Q(extracted_experience_years__isnull=True)
+                | Q(extracted_experience_years__lte=experience_max_years)
+            )
+    if age_min_years is not None:
+        if exclude_unknowns:
+            queryset = queryset.filter(extracted_age_years__gte=age_min_years)
+        else:
+            queryset = queryset.filter(
+                Q(extracted_age_years__isnull=True)
+                | Q(extracted_age_years__gte=age_min_years)
+            )
+    if age_max_years is not None:
+        if exclude_unknowns:
+            queryset = queryset.filter(extracted_age_years__lte=age_max_years)
+        else:
+            queryset = queryset.filter(
+                Q(extracted_age_years__isnull=True)
+                | Q(extracted_age_years__lte=age_max_years)
+            )
+    return queryset
+
+
+def _build_snippet(text: str, terms: list[str], max_len: int = SEARCH_SNIPPET_LEN, lowered: str = "") -> str:
+    # lowered is the document's stored extracted_text_normalized, which is
+    # _normalize_for_match of the same text; it is only recomputed if missing.
+    if not text or not terms:
+        return ""
+    normalized = " ".join(text.split())
+    if not lowered:
+        lowered = _normalize_for_match(normalized)
+    match_index = None
+    match_term = ""
+    for term in terms:
+        # Only an occurrence before the current best can win, so later
+        # terms never scan past it.
+        end = len(lowered) if match_index is None else match_index + len(term) - 1
+        idx = lowered.find(term, 0, end)
+        if idx == -1:
+            continue
+        if match_index is None or idx < match_index:
+            match_index = idx
+            match_term = term
+    if match_index is None:
+        return ""
+    radius = max_len // 2
+    start = max(0, match_index - radius)
+    end = min(len(normalized), match_index + len(match_term) + radius)
+    snippet = normalized[start:end].strip()
+    if start > 0:
+        snippet = "..." + snippet
+    if end < len(normalized):
+        snippet = snippet + "..."
+    return snippet
+
+
+def _load_extraction_fields():
+    # The builtin field table is small and only edited through the admin.
+    return cache.get_or_set(
+        EXTRACTION_FIELDS_CACHE_KEY,
+        lambda: list(ExtractionField.objects.order_by("label")),
+        EXTRACTION_FIELDS_CACHE_SECONDS,
+    )
+
+
+@receiver([post_save, post_delete], sender=ExtractionField)
+def _clear_extraction_fields_cache(**kwargs):
+    cache.delete(EXTRACTION_FIELDS_CACHE_KEY)
+
+
+def _builtin_field_pairs(fields=None):
+    # resolve_intent breaks ties by position, so keep the table's id order.
+    if fields is None:
+        fields = _load_extraction_fields()
+    return [(field.key, field.label) for field in sorted(fields, key=lambda field: field.pk)]
+
+
+def _load_extraction_catalog(user):
+    fields = _load_extraction_fields()
+    keywords = list(ExtractionKeyword.objects.filter(owner=user).order_by("label"))
+    return fields, keywords
+
+
+def _build_field_choices(user, catalog=None):
+    fields, keywords = catalog or _load_extraction_catalog(user)
+    field_choices = [(field.key, field.label) for field in fields]
+    keyword_choices = [(f"{KEYWORD_PREFIX}{keyword.id}", keyword.label) for keyword in keywords]
+    return field_choices + keyword_choices
+
+
+def _filter_enabled_fields(choices, enabled_fields):
+    allowed = {value for value, _ in choices}
+    filtered = [value for value in (enabled_fields or []) if value in allowed]
+    return list(dict.fromkeys(filtered))
+
+
+def _get_profile(user):
+    profile, _ = ExtractionProfile.objects.get_or_create(owner=user)
+    if profile.enabled_fields is None:
+        profile.enabled_fields = []
+        profile.save(update_fields=["enabled_fields"])
+    return profile
+
+
+def _remove_keyword_from_documents(user, keyword_key: str):
+    if connection.vendor == "postgresql":
+        table = connection.ops.quote_name(Document._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                REMOVE_SELECTED_FIELD_SQL.format(table=table),
+                [keyword_key, user.id, keyword_key],
+            )
+            return cursor.rowcount
+    # The substring match is only a portable prefilter (it also hits e.g.
+    # "keyword:12" for "keyword:1"); membership is checked exactly below.
+    candidates = Document.objects.filter(owner=user, selected_fields__icontains=keyword_key).only("id", "selected_fields")
+    changed = []
+    for doc in candidates.iterator():
+        selected = doc.selected_fields or []
+        if keyword_key not in selected:
+            continue
+        doc.selected_fields = [value for value in selected if value != keyword_key]
+        changed.append(doc)
+    Document.objects.bulk_update(changed, ["selected_fields"], batch_size=500)
+    return len(changed)
+
+
+def _safe_name(filename: str, fallback: str) -> str:
+    base_name = os.path.basename(filename or "").strip()
+    if not base_name:
+        base_name = fallback
+    safe_name = get_valid_filename(base_name)
+    return safe_name or fallback
+
+
+def _unique_name(filename: str, used_names: set[str], token: str) -> str:
+    if filename not in used_names:
+        used_names.add(filename)
+        return filename
+    base, ext = os.path.splitext(filename)
+    candidate = f"{base}-{token}{ext}"
+    if candidate in used_names:
+        counter = 2
+        while f"{base}-{token}-{counter}{ext}" in used_names:
+            counter += 1
+        candidate = f"{base}-{token}-{counter}{ext}"
+    used_names.add(candidate)
+    return candidate
+
+
+def _zip_file(target) -> zipfile.ZipFile:
+    return zipfile.ZipFile(target, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=ZIP_COMPRESS_LEVEL)
+
+
+def _zip_entry(filename: str) -> zipfile.ZipInfo | str:
+    # Deflated entries are opened by name so they inherit the archive's
+    # compression level.
+    if os.path.splitext(filename)[1].lower() not in ZIP_STORED_EXTENSIONS:
+        return filename
+    info = zipfile.ZipInfo(filename, date_time=time.localtime()[:6])
+    info.compress_type = zipfile.ZIP_STORED
+    return info
+
+
+def _zip_buffer():
+    # Small archives stay in memory; larger ones spill to a temp file that
+    # FileResponse streams and closes.
+    return tempfile.SpooledTemporaryFile(max_size=ZIP_SPOOL_MAX_BYTES)
+
+
+def _attachment_response(file_obj, filename: str, content_type=None):
+    response = FileResponse(file_obj, as_attachment=True, filename=filename, content_type=content_type)
+    response.block_size = DOWNLOAD_BLOCK_SIZE
+    return response
+
+
+def _zip_response(buffer, filename: str):
+    buffer.seek(0)
+    return _attachment_response(buffer, filename, "application/zip")
+
+
+class _ZipStreamBuffer:
+    def __init__(self):
+        self._chunks = deque()
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        while self._chunks:
+            yield self._chunks.popleft()
+
+
+def _iter_zip_stream(entries):
+    # ZipFile falls back to data descriptors on an unseekable target, so each
+    # entry can be sent as soon as it is compressed.
+    buffer = _ZipStreamBuffer()
+    with _zip_file(buffer) as zip_file:
+        for filename, chunks in entries:
+            with zip_file.open(_zip_entry(filename), "w") as dest:
+                for chunk in chunks:
+                    dest.write(chunk)
+                    yield from buffer.drain()
+    yield from buffer.drain()
+
+
+def _zip_stream_response(entries, filename: str):
+    response = StreamingHttpResponse(_iter_zip_stream(entries), content_type="application/zip")
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+def _iter_json_zip_entries(docs):
+    used_names = set()
+    for doc in docs:
+        filename = _build_json_filename(doc)
+        if filename in used_names:
+            base, ext = os.path.splitext(filename)
+            filename = f"{base}-{str(doc.id)[:8]}{ext}"
+        used_names.add(filename)
+        yield filename, _iter_json_chunks(sanitize_payload(doc.extracted_json))
+
+
+def _encode_json_download(data) -> bytes:
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, option=ORJSON_DOWNLOAD_OPTIONS)
+        except TypeError:
+            pass
+    return JSON_DOWNLOAD_ENCODER.encode(data).encode("utf-8")
+
+
+def _iter_json_chunks(data, chunk_size=64 * 1024):
+    if orjson is not None:
+        yield _encode_json_download(data)
+        return
+    # iterencode yields tiny fragments; they are batched before compression.
+    parts = []
+    size = 0
+    for part in JSON_DOWNLOAD_ENCODER.iterencode(data):
+        parts.append(part)
+        size += len(part)
+        if size >= chunk_size:
+            yield "".join(parts).encode("utf-8")
+            parts = []
+            size = 0
+    if parts:
+        yield "".join(parts).encode("utf-8")
+
+
+def _iter_file_chunks(file_obj, chunk_size=1024 * 1024):
+    if hasattr(file_obj, "chunks"):
+        for chunk in file_obj.chunks(chunk_size=chunk_size):
+            if chunk:
+                yield chunk
+        return
+    while True:
+        chunk = file_obj.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+def _build_json_filename(doc):
+    base_name = doc.original_filename or str(doc.id)
+    base_name = os.path.splitext(base_name)[0]
+    safe_name = get_valid_filename(base_name) or str(doc.id)
+    return f"{safe_name}.json"
@@ -1,178 +1,66 @@
-import io
 import json
 import logging
 import os
-import re
-import zipfile
+from concurrent.futures import ThreadPoolExecutor
 
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
-from django.db import transaction
+from django.db import IntegrityError, transaction
 from django.db.models import Q
-from django.http import FileResponse, HttpResponse, HttpResponseForbidden
+from django.http import HttpResponse, HttpResponseForbidden
 from django.shortcuts import get_object_or_404, redirect, render
-from django.utils.text import get_valid_filename
 
 from .forms import ExtractionSettingsForm, FilterPresetForm, KeywordForm, MultiUploadForm
 from .intent import resolve_intent
 from .models import (
     Document,
     DocumentStatus,
-    ExtractionField,
     ExtractionKeyword,
-    ExtractionProfile,
     FilterPreset,
     STRATEGY_CHOICES,
     VALUE_TYPE_CHOICES,
     _normalize_keyword,
+    active_processing_q,
 )
-from .services import KEYWORD_PREFIX, _normalize_for_match, sanitize_payload
+from .services import KEYWORD_PREFIX, sanitize_payload
 from .tasks import process_document_task
+from .view_helpers import (
+    MAX_BULK,
+    CachedCountPaginator,
+    _apply_preset_filters,
+    _apply_term_filters,
+    _attachment_response,
+    _build_field_choices,
+    _builtin_field_pairs,
+    _build_json_filename,
+    _build_snippet,
+    _encode_json_download,
+    _filter_enabled_fields,
+    _get_profile,
+    _iter_file_chunks,
+    _iter_json_zip_entries,
+    _load_extraction_catalog,
+    _remove_keyword_from_documents,
+    _safe_name,
+    _search_count_key,
+    _split_terms,
+    _unique_name,
+    _zip_buffer,
+    _zip_entry,
+    _zip_file,
+    _zip_response,
+    _zip_stream_response,
+)
 
 PAGE_SIZE = 10
-MAX_BULK = 25
-SEARCH_SNIPPET_LEN = 120
-
-TERM_SPLIT_RE = re.compile(r"[,\s]+")
+UPLOAD_SAVE_WORKERS = 4
 
 logger = logging.getLogger(__name__)
 
 
-def _split_terms(raw: str) -> list[str]:
-    if not raw:
-        return []
-    if ";" in raw:
-        parts = [term.strip() for term in raw.split(";") if term.strip()]
-    else:
-        parts = [term.strip() for term in TERM_SPLIT_RE.split(raw) if term.strip()]
-    normalized_terms = []
-    seen = set()
-    for term in parts:
-        normalized = _normalize_for_match(term)
-        if not normalized or normalized in seen:
-            continue
-        seen.add(normalized)
-        normalized_terms.append(normalized)
-    return normalized_terms
-
-
-def _apply_term_filters(queryset, terms: list[str], *, mode: str = "all", field: str = "text_content_norm"):
-    if not terms:
-        return queryset
-    if mode == "any":
-        query = Q()
-        for term in terms:
-            query |= Q(**{f"{field}__icontains": term})
-        return queryset.filter(query)
-    for term in terms:
-        queryset = queryset.filter(**{f"{field}__icontains": term})
-    return queryset
-
-
-def _apply_preset_filters(
-    queryset,
-    preset: FilterPreset,
-    *,
-    experience_min_years: int | None = None,
-    experience_max_years: int | None = None,
-    age_min_years: int | None = None,
-    age_max_years: int | None = None,
-    exclude_unknowns: bool | None = None,
-):
-    if not preset:
-        return queryset
-    if experience_min_years is None:
-        experience_min_years = preset.experience_min_years
-    if experience_max_years is None:
-        experience_max_years = preset.experience_max_years
-    if age_min_years is None:
-        age_min_years = preset.age_min_years
-    if age_max_years is None:
-        age_max_years = preset.age_max_years
-    if exclude_unknowns is None:
-        exclude_unknowns = preset.exclude_unknowns
-    if experience_min_years is not None:
-        if exclude_unknowns:
-            queryset = queryset.filter(extracted_experience_years__gte=experience_min_years)
-        else:
-            queryset = queryset.filter(
-                Q(extracted_experience_years__isnull=True)
-                | Q(extracted_experience_years__gte=experience_min_years)
-            )
-    if experience_max_years is not None:
-        if exclude_unknowns:
-            queryset = queryset.filter(extracted_experience_years__lte=experience_max_years)
-        else:
-            queryset = queryset.filter(
-                Q(extracted_experience_years__isnull=True)
-                | Q(extracted_experience_years__lte=experience_max_years)
-            )
-    if age_min_years is not None:
-        if exclude_unknowns:
-            queryset = queryset.filter(extracted_age_years__gte=age_min_years)
-        else:
-            queryset = queryset.filter(
-                Q(extracted_age_years__isnull=True)
-                | Q(extracted_age_years__gte=age_min_years)
-            )
-    if age_max_years is not None:
-        if exclude_unknowns:
-            queryset = queryset.filter(extracted_age_years__lte=age_max_years)
-        else:
-            queryset = queryset.filter(
-                Q(extracted_age_years__isnull=True)
-                | Q(extracted_age_years__lte=age_max_years)
-            )
-    return queryset
-
-
-def _build_snippet(text: str, terms: list[str], max_len: int = SEARCH_SNIPPET_LEN) -> str:
-    if not text or not terms:
-        return ""
-    normalized = " ".join(text.split())
-    lowered = _normalize_for_match(normalized)
-    match_index = None
-    match_term = ""
-    for term in terms:
-        idx = lowered.find(term)
-        if idx == -1:
-            continue
-        if match_index is None or idx < match_index:
-            match_index = idx
-            match_term = term
-    if match_index is None:
-        return ""
-    radius = max_len // 2
-    start = max(0, match_index - radius)
-    end = min(len(normalized), match_index + len(match_term) + radius)
-    snippet = normalized[start:end].strip()
-    if start > 0:
-        snippet = "..." + snippet
-    if end < len(normalized):
-        snippet = snippet + "..."
-    return snippet
-
-
-def _build_field_choices(user):
-    fields = ExtractionField.objects.order_by("label")
-    field_choices = [(field.key, field.label) for field in fields]
-    keywords = ExtractionKeyword.objects.filter(owner=user).order_by("label")
-    keyword_choices = [(f"{KEYWORD_PREFIX}{keyword.id}", keyword.label) for keyword in keywords]
-    return field_choices + keyword_choices
-
-
-def _filter_enabled_fields(choices, enabled_fields):
-    allowed = {value for value, _ in choices}
-    filtered = [value for value in (enabled_fields or []) if value in allowed]
-    return list(dict.fromkeys(filtered))
-
-
-def _get_profile(user):
-    profile, _ = ExtractionProfile.objects.get_or_create(owner=user)
-    if profile.enabled_fields is None:
-        profile.enabled_fields = []
-        profile.save(update_fields=["enabled_fields"])
-    return profile
+def _store_upload(doc, file_obj):
+    # bulk_create skips Document.save, so record the stored path here.
+    doc.file.save(file_obj.name, file_obj, save=False)
+    doc.stored_path = doc.file.name
 
 
 def _get_force_ocr(request) -> bool:
@@ -192,22 +80,30 @@ def upload_documents(request):
             if selected_fields != (profile.enabled_fields or []):
                 profile.enabled_fields = selected_fields
                 profile.save(update_fields=["enabled_fields", "updated_at"])
-            created_docs = []
-            logger.info(
-                "upload_documents user=%s count=%s files=%s",
-                request.user.id,
-                len(files),
-                filenames,
-            )
+            logger.info("upload_documents user=%s count=%s", request.user.id, len(files))
+            logger.debug("upload_documents_files user=%s files=%s", request.user.id, filenames)
             with transaction.atomic():
-                for file_obj in files:
-                    doc = Document.objects.create(
+                created_docs = [
+                    Document(
                         owner=request.user,
-                        file=file_obj,
                         original_filename=file_obj.name,
                         selected_fields=selected_fields,
                     )
-                    created_docs.append(doc)
+                    for file_obj in files
+                ]
+                # Storage writes (network round trips on S3) overlap; when two
+                # uploads sanitize to the same storage name they are stored one
+                # at a time so the storage still picks distinct names for them.
+                storage_names = {
+                    doc.file.field.generate_filename(doc, file_obj.name)
+                    for doc, file_obj in zip(created_docs, files)
+                }
+                workers = 1
+                if len(storage_names) == len(files):
+                    workers = min(UPLOAD_SAVE_WORKERS, len(files))
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    list(executor.map(_store_upload, created_docs, files))
+                Document.objects.bulk_create(created_docs)
                 for doc in created_docs:
                     transaction.on_commit(
                         lambda doc_id=str(doc.id): process_document_task.delay(doc_id)
@@ -323,10 +219,22 @@ def documents_list(request):
     docs = _apply_term_filters(docs, effective_terms, mode=effective_mode)
     if effective_exclude_terms:
         for term in effective_exclude_terms:
-            docs = docs.exclude(text_content_norm__icontains=term)
+            docs = docs.exclude(extracted_text_normalized__contains=term)
 
-    docs = docs.order_by("-uploaded_at")
-    paginator = Paginator(docs, PAGE_SIZE)
+    # The list only needs to know whether a JSON exists, and the text columns
+    # only feed search snippets.
+    docs = docs.order_by("-uploaded_at").defer("extracted_json").annotate(
+        has_extracted_json=~Q(extracted_json__isnull=True) & ~Q(extracted_json={})
+    )
+    if not effective_terms:
+        docs = docs.defer("extracted_text", "extracted_text_normalized")
+    query_params = request.GET.copy()
+    query_params.pop("page", None)
+    querystring = query_params.urlencode()
+    count_key = ""
+    if effective_terms or effective_exclude_terms:
+        count_key = _search_count_key(request.user.id, querystring)
+    paginator = CachedCountPaginator(docs, PAGE_SIZE, count_key=count_key)
     page_obj = paginator.get_page(request.GET.get("page"))
     result_count = paginator.count
 
@@ -342,12 +250,13 @@ def documents_list(request):
 
     snippet_terms = effective_terms
     for doc in page_obj:
-        snippet_source = doc.text_content or doc.extracted_text or ""
-        doc.search_snippet = _build_snippet(snippet_source, snippet_terms)
-
-    query_params = request.GET.copy()
-    query_params.pop("page", None)
-    querystring = query_params.urlencode()
+        if not snippet_terms:
+            doc.search_snippet = ""
+            continue
+        snippet_source = doc.extracted_text or ""
+        doc.search_snippet = _build_snippet(
+            snippet_source, snippet_terms, lowered=doc.extracted_text_normalized
+        )
 
     return render(
         request,
@@ -381,7 +290,8 @@ def payments_view(request):
 @login_required
 def extraction_settings(request):
     profile = _get_profile(request.user)
-    choices = _build_field_choices(request.user)
+    catalog = _load_extraction_catalog(request.user)
+    choices = _build_field_choices(request.user, catalog)
     current_fields = _filter_enabled_fields(choices, profile.enabled_fields)
     if request.method != "POST":
         logger.info(
@@ -394,7 +304,7 @@ def extraction_settings(request):
         keyword_form = KeywordForm(request.POST)
         action = request.POST.get("action", "save")
         post_enabled = request.POST.getlist("enabled_fields")
-        logger.info(
+        logger.debug(
             "extraction_settings_post user=%s action=%s enabled_fields=%s new_keyword=%s value_type=%s strategy=%s params=%s",
             request.user.id,
             action,
@@ -414,12 +324,8 @@ def extraction_settings(request):
                 keyword_form.add_error("new_keyword", "Informe uma palavra-chave.")
             elif normalized in {"", None}:
                 keyword_form.add_error("new_keyword", "Informe uma palavra-chave valida.")
-            elif ExtractionKeyword.objects.filter(
-                owner=request.user, normalized_label=normalized
-            ).exists():
-                keyword_form.add_error("new_keyword", "Essa palavra-chave ja existe.")
             else:
-                builtin_fields = list(ExtractionField.objects.values_list("key", "label"))
+                builtin_fields = _builtin_field_pairs(catalog[0])
                 intent = resolve_intent(keyword_value, builtin_fields, allow_llm=False)
                 anchors = intent.anchors or [keyword_value.strip()]
                 value_types = {key for key, _ in VALUE_TYPE_CHOICES}
@@ -444,44 +350,50 @@ def extraction_settings(request):
                     strategy_params = {}
                 if strategy == "below_n_lines" and "max_lines" not in strategy_params:
                     strategy_params["max_lines"] = 3
-                keyword = ExtractionKeyword.objects.create(
-                    owner=request.user,
-                    label=keyword_value,
-                    field_key=intent.builtin_key if intent.kind == "builtin" else "",
-                    resolved_kind=intent.kind,
-                    inferred_type=value_type,
-                    value_type=value_type,
-                    strategy=strategy,
-                    strategy_params=strategy_params,
-                    anchors=anchors,
-                    match_strategy=intent.match_strategy,
-                    confidence=float(intent.confidence or 0.0),
-                )
-                enabled_fields = _filter_enabled_fields(choices, post_enabled)
-                enabled_fields.append(f"{KEYWORD_PREFIX}{keyword.id}")
-                profile.enabled_fields = enabled_fields
-                profile.save(update_fields=["enabled_fields", "updated_at"])
-                logger.info(
-                    "extraction_keyword_add user=%s keyword=%s kind=%s field_key=%s value_type=%s strategy=%s params=%s",
-                    request.user.id,
-                    keyword.label,
-                    keyword.resolved_kind,
-                    keyword.field_key,
-                    keyword.value_type,
-                    keyword.strategy,
-                    keyword.strategy_params,
-                )
-                logger.info(
-                    "extraction_settings_save user=%s enabled_fields=%s",
-                    request.user.id,
-                    enabled_fields,
-                )
-                return redirect("extraction_settings")
+                try:
+                    with transaction.atomic():
+                        keyword = ExtractionKeyword.objects.create(
+                            owner=request.user,
+                            label=keyword_value,
+                            field_key=intent.builtin_key if intent.kind == "builtin" else "",
+                            resolved_kind=intent.kind,
+                            inferred_type=value_type,
+                            value_type=value_type,
+                            strategy=strategy,
+                            strategy_params=strategy_params,
+                            anchors=anchors,
+                            match_strategy=intent.match_strategy,
+                            confidence=float(intent.confidence or 0.0),
+                        )
+                except IntegrityError:
+                    keyword_form.add_error("new_keyword", "Essa palavra-chave ja existe.")
+                else:
+                    enabled_fields = _filter_enabled_fields(choices, post_enabled)
+                    enabled_fields.append(f"{KEYWORD_PREFIX}{keyword.id}")
+                    profile.enabled_fields = enabled_fields
+                    profile.save(update_fields=["enabled_fields", "updated_at"])
+                    logger.info(
+                        "extraction_keyword_add user=%s keyword=%s kind=%s field_key=%s value_type=%s strategy=%s params=%s",
+                        request.user.id,
+                        keyword.label,
+                        keyword.resolved_kind,
+                        keyword.field_key,
+                        keyword.value_type,
+                        keyword.strategy,
+                        keyword.strategy_params,
+                    )
+                    logger.info(
+                        "extraction_settings_save user=%s enabled_fields=%s",
+                        request.user.id,
+                        enabled_fields,
+                    )
+                    return redirect("extraction_settings")
 
         if action != "add_keyword":
             enabled_fields = _filter_enabled_fields(choices, post_enabled)
-            profile.enabled_fields = enabled_fields
-            profile.save(update_fields=["enabled_fields", "updated_at"])
+            if enabled_fields != (profile.enabled_fields or []):
+                profile.enabled_fields = enabled_fields
+                profile.save(update_fields=["enabled_fields", "updated_at"])
             logger.info("extraction_profile_update user=%s fields=%s", request.user.id, enabled_fields)
             logger.info(
                 "extraction_settings_save user=%s enabled_fields=%s",
@@ -499,8 +411,8 @@ def extraction_settings(request):
         {
             "form": form,
             "keyword_form": keyword_form,
-            "keywords": ExtractionKeyword.objects.filter(owner=request.user).order_by("label"),
-            "fields": ExtractionField.objects.order_by("label"),
+            "keywords": catalog[1],
+            "fields": catalog[0],
         },
     )
 
@@ -565,12 +477,7 @@ def delete_keyword(request, keyword_id):
         profile.enabled_fields = [value for value in profile.enabled_fields if value != keyword_key]
         profile.save(update_fields=["enabled_fields", "updated_at"])
 
-    for doc in Document.objects.filter(owner=request.user).iterator():
-        selected = doc.selected_fields or []
-        if keyword_key not in selected:
-            continue
-        doc.selected_fields = [value for value in selected if value != keyword_key]
-        doc.save(update_fields=["selected_fields"])
+    _remove_keyword_from_documents(request.user, keyword_key)
 
     keyword.delete()
     logger.info("extraction_keyword_delete user=%s keyword=%s", request.user.id, keyword_label)
@@ -582,10 +489,14 @@ def process_document_view(request, doc_id):
     if request.method != "POST":
         return HttpResponseForbidden("Método inválido.")
 
-    doc = get_object_or_404(Document, id=doc_id, owner=request.user)
+    doc = get_object_or_404(
+        Document.objects.only("id", "original_filename", "status", "processing_started_at"),
+        id=doc_id,
+        owner=request.user,
+    )
     allow_reprocess = request.POST.get("reprocess") == "1"
 
-    if doc.status == DocumentStatus.PROCESSING:
+    if doc.is_processing():
         return redirect("documents_list")
     if doc.status == DocumentStatus.DONE and not allow_reprocess:
         return redirect("documents_list")
@@ -625,7 +536,8 @@ def process_documents_bulk(request):
 
     qs = (
         Document.objects.filter(owner=request.user, id__in=ids)
-        .exclude(status=DocumentStatus.PROCESSING)
+        .exclude(active_processing_q())
+        .only("id", "original_filename")
     )
     if action != "reprocess":
         qs = qs.exclude(status=DocumentStatus.DONE)
@@ -655,59 +567,19 @@ def process_documents_bulk(request):
 
 @login_required
 def download_document(request, doc_id):
-    doc = get_object_or_404(Document, id=doc_id, owner=request.user)
+    doc = get_object_or_404(Document.objects.only("id", "original_filename", "file"), id=doc_id, owner=request.user)
     filename = doc.original_filename or os.path.basename(doc.file.name)
-    return FileResponse(doc.file.open("rb"), as_attachment=True, filename=filename)
-
-
-def _safe_name(filename: str, fallback: str) -> str:
-    base_name = os.path.basename(filename or "").strip()
-    if not base_name:
-        base_name = fallback
-    safe_name = get_valid_filename(base_name)
-    return safe_name or fallback
-
-
-def _unique_name(filename: str, used_names: set[str], token: str) -> str:
-    if filename not in used_names:
-        used_names.add(filename)
-        return filename
-    base, ext = os.path.splitext(filename)
-    candidate = f"{base}-{token}{ext}"
-    if candidate in used_names:
-        counter = 2
-        while f"{base}-{token}-{counter}{ext}" in used_names:
-            counter += 1
-        candidate = f"{base}-{token}-{counter}{ext}"
-    used_names.add(candidate)
-    return candidate
-
-
-def _iter_file_chunks(file_obj, chunk_size=1024 * 1024):
-    if hasattr(file_obj, "chunks"):
-        for chunk in file_obj.chunks(chunk_size=chunk_size):
-            if chunk:
-                yield chunk
-        return
-    while True:
-        chunk = file_obj.read(chunk_size)
-        if not chunk:
-            break
-        yield chunk
-
-
-def _build_json_filename(doc):
-    base_name = doc.original_filename or str(doc.id)
-    base_name = os.path.splitext(base_name)[0]
-    safe_name = get_valid_filename(base_name) or str(doc.id)
-    return f"{safe_name}.json"
+    return _attachment_response(doc.file.open("rb"), filename)
 
 
 @login_required
 def download_document_json(request, doc_id):
-    doc = get_object_or_404(Document, id=doc_id, owner=request.user)
-    json_data = sanitize_payload(doc.extracted_json or {})
-    payload = json.dumps(json_data, ensure_ascii=False, indent=2)
+    doc = get_object_or_404(
+        Document.objects.only("id", "original_filename", "extracted_json"),
+        id=doc_id,
+        owner=request.user,
+    )
+    payload = _encode_json_download(sanitize_payload(doc.extracted_json or {}))
     filename = _build_json_filename(doc)
     response = HttpResponse(payload, content_type="application/json")
     response["Content-Disposition"] = f'attachment; filename="{filename}"'
@@ -724,35 +596,16 @@ def download_documents_json_bulk(request):
         return redirect("documents_list")
 
     docs = list(
-        Document.objects.filter(owner=request.user, id__in=ids)
+        Document.objects.filter(owner=request.user, id__in=ids, extracted_json__isnull=False)
+        .exclude(extracted_json={})
+        .only("id", "original_filename", "extracted_json")
         .order_by("-uploaded_at")
     )
-
-    buffer = io.BytesIO()
-    used_names = set()
-    added = 0
-
-    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as zip_file:
-        for doc in docs:
-            if not doc.extracted_json:
-                continue
-            json_data = sanitize_payload(doc.extracted_json or {})
-            payload = json.dumps(json_data, ensure_ascii=False, indent=2)
-            filename = _build_json_filename(doc)
-            if filename in used_names:
-                base, ext = os.path.splitext(filename)
-                filename = f"{base}-{str(doc.id)[:8]}{ext}"
-            used_names.add(filename)
-            zip_file.writestr(filename, payload)
-            added += 1
-
-    if added == 0:
+    if not docs:
         return redirect("documents_list")
 
-    buffer.seek(0)
-    response = HttpResponse(buffer.getvalue(), content_type="application/zip")
-    response["Content-Disposition"] = 'attachment; filename="documentos-json.zip"'
-    logger.info("bulk_json_download user=%s count=%s", request.user.id, added)
+    response = _zip_stream_response(_iter_json_zip_entries(docs), "documentos-json.zip")
+    logger.info("bulk_json_download user=%s count=%s", request.user.id, len(docs))
     return response
 
 
@@ -767,15 +620,16 @@ def download_documents_files_bulk(request):
 
     docs = list(
         Document.objects.filter(owner=request.user, id__in=ids)
+        .only("id", "original_filename", "file")
         .order_by("-uploaded_at")
     )
 
-    buffer = io.BytesIO()
+    buffer = _zip_buffer()
     used_names = set()
     added = 0
     missing = 0
 
-    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as zip_file:
+    with _zip_file(buffer) as zip_file:
         for doc in docs:
             if not doc.file:
                 missing += 1
@@ -788,7 +642,7 @@ def download_documents_files_bulk(request):
             filename = _unique_name(safe_name, used_names, str(doc.id)[:8])
             try:
                 with doc.file.open("rb") as file_obj:
-                    with zip_file.open(filename, "w") as dest:
+                    with zip_file.open(_zip_entry(filename), "w") as dest:
                         for chunk in _iter_file_chunks(file_obj):
                             dest.write(chunk)
                 added += 1
@@ -796,11 +650,10 @@ def download_documents_files_bulk(request):
                 missing += 1
 
     if added == 0:
+        buffer.close()
         return HttpResponse("Nenhum arquivo disponivel para download.", status=400)
 
-    buffer.seek(0)
-    response = HttpResponse(buffer.getvalue(), content_type="application/zip")
-    response["Content-Disposition"] = 'attachment; filename="documentos-arquivos.zip"'
+    response = _zip_response(buffer, "documentos-arquivos.zip")
     logger.info(
         "bulk_files_download user=%s count=%s missing=%s",
         request.user.id,
@@ -812,6 +665,10 @@ def download_documents_files_bulk(request):
 
 @login_required
 def document_json_view(request, doc_id):
-    doc = get_object_or_404(Document, id=doc_id, owner=request.user)
+    doc = get_object_or_404(
+        Document.objects.only("id", "original_filename", "extracted_json"),
+        id=doc_id,
+        owner=request.user,
+    )
     json_data = sanitize_payload(doc.extracted_json or {})
     return render(request, "documents/json.html", {"doc": doc, "json_data": json_data})